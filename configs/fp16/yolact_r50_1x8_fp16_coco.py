@@ -0,0 +1,3 @@
+_base_ = '../yolact/yolact_r50_1x8_coco.py'
+# fp16 settings
+fp16 = dict(loss_scale=512.)
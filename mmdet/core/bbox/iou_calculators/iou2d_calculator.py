@@ -40,6 +40,27 @@ class BboxOverlaps2D(object):
         return repr_str
 
 
+@torch.jit.script
+def _pairwise_iou(bboxes1, bboxes2, eps: float):
+    """Scripted IoU between each bbox of (m, 4) bboxes1 and (n, 4) bboxes2.
+
+    The x and y extents of the overlaps are computed separately, so the
+    elementwise chain can be fused by the JIT and no (m, n, 2) intermediates
+    are created.
+    """
+    area1 = (bboxes1[:, 2] - bboxes1[:, 0]) * (bboxes1[:, 3] - bboxes1[:, 1])
+    area2 = (bboxes2[:, 2] - bboxes2[:, 0]) * (bboxes2[:, 3] - bboxes2[:, 1])
+    w = (torch.min(bboxes1[:, 2].unsqueeze(1), bboxes2[:, 2].unsqueeze(0)) -
+         torch.max(bboxes1[:, 0].unsqueeze(1),
+                   bboxes2[:, 0].unsqueeze(0))).clamp(min=0)
+    h = (torch.min(bboxes1[:, 3].unsqueeze(1), bboxes2[:, 3].unsqueeze(0)) -
+         torch.max(bboxes1[:, 1].unsqueeze(1),
+                   bboxes2[:, 1].unsqueeze(0))).clamp(min=0)
+    overlap = w * h
+    union = (area1.unsqueeze(1) + area2.unsqueeze(0) - overlap).clamp(min=eps)
+    return overlap / union
+
+
 def bbox_overlaps(bboxes1, bboxes2, mode='iou', is_aligned=False, eps=1e-6):
     """Calculate overlap between two set of bboxes.
 
@@ -108,6 +129,10 @@ def bbox_overlaps(bboxes1, bboxes2, mode='iou', is_aligned=False, eps=1e-6):
         else:
             return bboxes1.new(batch_shape + (rows, cols))
 
+    if mode == 'iou' and not is_aligned and len(batch_shape) == 0:
+        # the common case of assigners, computed in a single fused pass
+        return _pairwise_iou(bboxes1, bboxes2, eps)
+
     area1 = (bboxes1[..., 2] - bboxes1[..., 0]) * (
         bboxes1[..., 3] - bboxes1[..., 1])
     area2 = (bboxes2[..., 2] - bboxes2[..., 0]) * (
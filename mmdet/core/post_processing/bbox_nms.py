@@ -1,7 +1,5 @@
 import torch
-from mmdet.ops.nms import batched_nms
-
-from mmdet.core.bbox.iou_calculators import bbox_overlaps
+from mmdet.ops.nms import batched_nms, fast_nms_keep
 
 def multiclass_nms(multi_bboxes,
                    multi_scores,
@@ -113,24 +111,51 @@ def fast_nms(multi_bboxes,
     boxes = multi_bboxes[idx.view(-1), :].view(num_classes, num_dets, 4)
     coeffs = multi_coeffs[idx.view(-1), :].view(num_classes, num_dets, -1)
 
-    iou = bbox_overlaps(boxes, boxes)  # [#class, topk, topk]
-    iou.triu_(diagonal=1)
-    iou_max, _ = iou.max(dim=1)
-
-    # Now just filter out the ones higher than the threshold
-    keep = iou_max <= iou_thr
+    if boxes.is_cuda:
+        # fused kernel, the [#class, topk, topk] iou is never materialized
+        keep = fast_nms_keep(boxes, iou_thr)
+    else:
+        # the strict upper triangle of the [#class, topk, topk] iou matrix is
+        # computed in blocks of rows, each box j only against the rows i < j,
+        # and the extents are broadcast from per-coordinate [#class, topk]
+        # slices, so neither the full matrix nor a pairwise gather of the
+        # 4 coordinates is materialized
+        x1, y1, x2, y2 = boxes.unbind(-1)
+        areas = (x2 - x1) * (y2 - y1)
+        det_inds = torch.arange(num_dets, device=boxes.device)
+        suppressed = boxes.new_zeros((num_classes, num_dets),
+                                     dtype=torch.bool)
+        block_size = 64
+        for start in range(0, num_dets, block_size):
+            rows = slice(start, min(start + block_size, num_dets))
+            w = (torch.min(x2[:, rows, None], x2[:, None, start:]) -
+                 torch.max(x1[:, rows, None], x1[:, None, start:])).clamp(
+                     min=0)
+            h = (torch.min(y2[:, rows, None], y2[:, None, start:]) -
+                 torch.max(y1[:, rows, None], y1[:, None, start:])).clamp(
+                     min=0)
+            overlap = w * h
+            # iou > iou_thr, compared without dividing by the union
+            conflicts = overlap > iou_thr * (
+                areas[:, rows, None] + areas[:, None, start:] - overlap)
+            # Now just filter out the ones suppressed by any higher-scored box
+            conflicts &= det_inds[rows, None] < det_inds[None, start:]
+            suppressed[:, start:] |= conflicts.any(1)
+        keep = ~suppressed
 
     # Second thresholding introduces 0.2 mAP gain at negligible time cost
-    keep *= scores > score_thr
+    keep &= scores > score_thr
 
-    # Assign each kept detection to its corresponding class
+    # Gather the kept detections with a single nonzero, which is the only
+    # device to host sync, and assign each one to its corresponding class
+    keep_inds = keep.view(-1).nonzero().squeeze(1)
     classes = torch.arange(
         num_classes, device=boxes.device)[:, None].expand_as(keep)
-    classes = classes[keep]
+    classes = classes.reshape(-1)[keep_inds]
 
-    boxes = boxes[keep]
-    coeffs = coeffs[keep]
-    scores = scores[keep]
+    boxes = boxes.view(-1, 4)[keep_inds]
+    coeffs = coeffs.view(num_classes * num_dets, -1)[keep_inds]
+    scores = scores.reshape(-1)[keep_inds]
 
     # Only keep the top max_num highest scores across all classes
     scores, idx = scores.sort(0, descending=True)
@@ -1,16 +1,33 @@
-import mmcv
 import numpy as np
 import torch
 import torch.nn as nn
 import torch.nn.functional as F
 from mmcv.cnn import ConvModule, xavier_init
 
-from mmdet.core import (build_sampler, fast_nms, force_fp32, images_to_levels,
-                        multi_apply, unmap, anchor_inside_flags)
+from mmdet.core import (auto_fp16, build_sampler, fast_nms, force_fp32,
+                        multi_apply)
 from ..builder import HEADS, build_loss
 from .anchor_head import AnchorHead
 
 
+@torch.jit.script
+def _crop_masks(masks, rows, cols, x1, x2, y1, y2, with_sigmoid: bool):
+    """Zero out the [H, W, N] masks outside the absolute box coordinates.
+
+    ``rows`` and ``cols`` are the [1, W, 1] and [H, 1, 1] pixel coordinates.
+    Scripted so that the optional sigmoid, the four comparisons and the
+    multiplication are fused into one elementwise pass instead of several
+    [H, W, N] intermediates.
+    """
+    if with_sigmoid:
+        masks = masks.sigmoid()
+    # the box test is separable, so the comparisons are done on [1, W, N]
+    # and [H, 1, N] and only their conjunction is broadcast to [H, W, N]
+    inside_w = (rows >= x1.view(1, 1, -1)) & (rows < x2.view(1, 1, -1))
+    inside_h = (cols >= y1.view(1, 1, -1)) & (cols < y2.view(1, 1, -1))
+    return masks * (inside_h & inside_w).to(masks.dtype)
+
+
 @HEADS.register_module()
 class YOLACTHead(AnchorHead):
     """YOLACT box head used in https://arxiv.org/abs/1904.02689.
@@ -36,6 +53,8 @@ class YOLACTHead(AnchorHead):
         norm_cfg (dict): Dictionary to construct and config norm layer.
     """
 
+    _version = 2
+
     def __init__(self,
                  num_classes,
                  in_channels,
@@ -70,6 +89,9 @@ class YOLACTHead(AnchorHead):
             loss_bbox=loss_bbox,
             anchor_generator=anchor_generator,
             **kwargs)
+        # anchors of the latest feature map sizes, keyed by the sizes and
+        # the device, since they are the same for every fixed-size input
+        self._anchor_cache = {}
         if self.use_ohem:
             sampler_cfg = dict(type='PseudoSampler')
             self.sampler = build_sampler(sampler_cfg, context=self)
@@ -94,16 +116,15 @@ class YOLACTHead(AnchorHead):
                     padding=1,
                     conv_cfg=self.conv_cfg,
                     norm_cfg=self.norm_cfg))
-        self.conv_cls = nn.Conv2d(
-            self.feat_channels,
-            self.num_anchors * self.cls_out_channels,
-            3,
-            padding=1)
-        self.conv_reg = nn.Conv2d(
-            self.feat_channels, self.num_anchors * 4, 3, padding=1)
-        self.conv_coeff = nn.Conv2d(
+        # cls, reg and coeff convs share the same input, so they are fused
+        # into a single conv whose output is split along the channels
+        self.head_split_channels = [
+            self.num_anchors * self.cls_out_channels, self.num_anchors * 4,
+            self.num_anchors * self.num_protos
+        ]
+        self.conv_head = nn.Conv2d(
             self.feat_channels,
-            self.num_anchors * self.num_protos,
+            sum(self.head_split_channels),
             3,
             padding=1)
 
@@ -111,9 +132,33 @@ class YOLACTHead(AnchorHead):
         """Initialize weights of the head."""
         for m in self.head_convs:
             xavier_init(m.conv, distribution='uniform', bias=0)
-        xavier_init(self.conv_cls, distribution='uniform', bias=0)
-        xavier_init(self.conv_reg, distribution='uniform', bias=0)
-        xavier_init(self.conv_coeff, distribution='uniform', bias=0)
+        # initialize the cls, reg and coeff blocks of the fused conv
+        # separately, the same as three independent convs
+        for weight in torch.split(self.conv_head.weight.data,
+                                  self.head_split_channels):
+            nn.init.xavier_uniform_(weight)
+        nn.init.constant_(self.conv_head.bias, 0)
+
+    def _load_from_state_dict(self, state_dict, prefix, local_metadata, strict,
+                              missing_keys, unexpected_keys, error_msgs):
+        version = local_metadata.get('version', None)
+
+        if version is None or version < 2:
+            # In version < 2, the cls, reg and coeff convs are separated, so
+            # their parameters are concatenated into the fused conv_head.
+            for name in ['weight', 'bias']:
+                keys = [
+                    prefix + conv + '.' + name
+                    for conv in ['conv_cls', 'conv_reg', 'conv_coeff']
+                ]
+                if (prefix + 'conv_head.' + name not in state_dict
+                        and all(key in state_dict for key in keys)):
+                    state_dict[prefix + 'conv_head.' + name] = torch.cat(
+                        [state_dict.pop(key) for key in keys])
+
+        super()._load_from_state_dict(state_dict, prefix, local_metadata,
+                                      strict, missing_keys, unexpected_keys,
+                                      error_msgs)
 
     def forward_single(self, x):
         """Forward feature of a single scale level.
@@ -130,66 +175,148 @@ class YOLACTHead(AnchorHead):
         """
         for head_conv in self.head_convs:
             x = head_conv(x)
-        cls_score = self.conv_cls(x)
-        bbox_pred = self.conv_reg(x)
-        coeff_pred = self.conv_coeff(x).tanh()
+        head_out = self.conv_head(x)
+        cls_channels, reg_channels, _ = self.head_split_channels
+        cls_score = head_out[:, :cls_channels]
+        bbox_pred = head_out[:, cls_channels:cls_channels + reg_channels]
+        # the conv output is a fresh tensor, so tanh is applied in place on
+        # the coeff slice, which is a plain view rather than a split output
+        coeff_pred = head_out[:, cls_channels + reg_channels:].tanh_()
         return cls_score, bbox_pred, coeff_pred
 
-    def get_num_level_anchors_inside(self, num_level_anchors, inside_flags):
-        split_inside_flags = torch.split(inside_flags, num_level_anchors)
-        num_level_anchors_inside = [
-            int(flags.sum()) for flags in split_inside_flags
+    def train(self, mode=True):
+        """Set the module in training or evaluation mode and drop the cached
+        anchors, which may live on a stale device."""
+        self._anchor_cache = {}
+        return super(YOLACTHead, self).train(mode)
+
+    def get_grid_anchors(self, featmap_sizes, device='cuda'):
+        """Get multi-level anchors, reusing the ones of the last call if the
+        feature map sizes and the device are unchanged.
+
+        Args:
+            featmap_sizes (list[tuple]): Multi-level feature map sizes.
+            device (torch.device | str): Device for returned tensors.
+
+        Returns:
+            list[Tensor]: Anchors of each level. They are shared by all the
+                callers with the same sizes, so they must not be modified in
+                place.
+        """
+        key = (tuple(tuple(size) for size in featmap_sizes), str(device))
+        if key not in self._anchor_cache:
+            # only keep the latest sizes, so the cache does not grow with
+            # multi-scale inputs
+            self._anchor_cache = {
+                key: self.anchor_generator.grid_anchors(featmap_sizes, device)
+            }
+        return self._anchor_cache[key]
+
+    def get_anchors(self, featmap_sizes, img_metas, device='cuda'):
+        """Get anchors according to feature map sizes.
+
+        Same as func:``AnchorHead.get_anchors``, but the anchors are
+        obtained from func:``get_grid_anchors``.
+        """
+        multi_level_anchors = self.get_grid_anchors(featmap_sizes, device)
+        anchor_list = [multi_level_anchors for _ in range(len(img_metas))]
+        valid_flag_list = [
+            self.anchor_generator.valid_flags(featmap_sizes,
+                                              img_meta['pad_shape'], device)
+            for img_meta in img_metas
         ]
+        return anchor_list, valid_flag_list
+
+    def get_num_level_anchors_inside(self, num_level_anchors, inside_flags):
+        num_levels = len(num_level_anchors)
+        device = inside_flags.device
+        level_ids = torch.repeat_interleave(
+            torch.arange(num_levels, device=device),
+            torch.tensor(num_level_anchors, device=device))
+        # count the inside anchors of all levels with a single segment sum
+        # and fetch the counts with a single device sync
+        num_level_anchors_inside = inside_flags.new_zeros(
+            num_levels, dtype=torch.long).scatter_add_(
+                0, level_ids, inside_flags.long()).tolist()
         return num_level_anchors_inside
 
+    def get_batch_inside_flags(self, batch_anchors, batch_valid_flags,
+                               img_metas):
+        """Check whether the anchors of all images are inside the border.
+
+        A batched version of func:``anchor_inside_flags``, the borders of all
+        images are compared with a single broadcasted expression, and the
+        top-left and bottom-right corners are each checked in one pass.
+
+        Args:
+            batch_anchors (Tensor): Anchors of all images with shape
+                (num_imgs, num_anchors, 4).
+            batch_valid_flags (Tensor): Valid flags of all images with shape
+                (num_imgs, num_anchors).
+            img_metas (list[dict]): Meta info of each image.
+
+        Returns:
+            Tensor: Flags indicating whether the anchors are inside a valid
+                range, with shape (num_imgs, num_anchors).
+        """
+        allowed_border = self.train_cfg.allowed_border
+        if allowed_border < 0:
+            return batch_valid_flags
+        # (w, h) + allowed_border of each image, with shape (num_imgs, 1, 2)
+        max_corners = batch_anchors.new_tensor(
+            [img_meta['img_shape'][1::-1]
+             for img_meta in img_metas])[:, None] + allowed_border
+        inside_flags = batch_valid_flags & \
+            (batch_anchors[..., :2] >= -allowed_border).all(dim=-1) & \
+            (batch_anchors[..., 2:] < max_corners).all(dim=-1)
+        return inside_flags
+
     def _get_targets_single(self,
                             flat_anchors,
-                            valid_flags,
+                            inside_flags,
                             num_level_anchors,
                             gt_bboxes,
                             gt_bboxes_ignore,
                             gt_labels,
                             gt_masks,
                             img_meta,
-                            label_channels=1,
-                            unmap_outputs=True):
-        """Compute regression and classification targets for anchors in
-            a single image.
+                            label_channels=1):
+        """Assign and sample the anchors of a single image.
+
+        Only the positive and negative samples are returned, the dense
+        targets of all images are written at once in
+        func:``_get_batch_samples``.
 
         Args:
             flat_anchors (Tensor): Multi-level anchors of the image, which are
                 concatenated into a single tensor of shape (num_anchors ,4)
-            valid_flags (Tensor): Multi level valid flags of the image,
+            inside_flags (Tensor): Multi level inside flags of the image,
                 which are concatenated into a single tensor of
                     shape (num_anchors,).
+            num_level_anchors (list[int]): Number of anchors of each level.
             gt_bboxes (Tensor): Ground truth bboxes of the image,
                 shape (num_gts, 4).
-            img_meta (dict): Meta info of the image.
             gt_bboxes_ignore (Tensor): Ground truth bboxes to be
                 ignored, shape (num_ignored_gts, 4).
-            img_meta (dict): Meta info of the image.
             gt_labels (Tensor): Ground truth labels of each box,
                 shape (num_gts,).
+            gt_masks (Tensor): Ground truth masks of each box.
+            img_meta (dict): Meta info of the image.
             label_channels (int): Channel of label.
-            unmap_outputs (bool): Whether to map outputs back to the original
-                set of anchors.
 
         Returns:
             tuple:
-                labels_list (list[Tensor]): Labels of each level
-                label_weights_list (list[Tensor]): Label weights of each level
-                bbox_targets_list (list[Tensor]): BBox targets of each level
-                bbox_weights_list (list[Tensor]): BBox weights of each level
-                num_total_pos (int): Number of positive samples in all images
-                num_total_neg (int): Number of negative samples in all images
+                pos_inds (Tensor): Indices of positive anchors in
+                    ``flat_anchors``.
+                neg_inds (Tensor): Indices of negative anchors in
+                    ``flat_anchors``.
+                pos_labels (Tensor): Labels of positive anchors.
+                pos_bbox_targets (Tensor): BBox targets of positive anchors.
+                sampling_result (:obj:``SamplingResult``): Sampler result.
         """
-        inside_flags = anchor_inside_flags(flat_anchors, valid_flags,
-                                           img_meta['img_shape'][:2],
-                                           self.train_cfg.allowed_border)
-        if not inside_flags.any():
-            return (None, ) * 6
+        inside_inds = inside_flags.nonzero().reshape(-1)
         # assign gt and sample anchors
-        anchors = flat_anchors[inside_flags, :]
+        anchors = flat_anchors[inside_inds, :]
         if self.iou_assign == 1:
             assign_result = self.assigner.assign(
                 anchors, gt_bboxes, gt_masks, gt_bboxes_ignore,
@@ -204,52 +331,129 @@ class YOLACTHead(AnchorHead):
         sampling_result = self.sampler.sample(assign_result, anchors,
                                               gt_bboxes)
 
-        num_valid_anchors = anchors.shape[0]
-        bbox_targets = torch.zeros_like(anchors)
-        bbox_weights = torch.zeros_like(anchors)
-        labels = anchors.new_full((num_valid_anchors, ),
-                                  self.background_label,
-                                  dtype=torch.long)
-        label_weights = anchors.new_zeros(num_valid_anchors, dtype=torch.float)
-
         pos_inds = sampling_result.pos_inds
-        neg_inds = sampling_result.neg_inds
         if len(pos_inds) > 0:
             if not self.reg_decoded_bbox:
                 pos_bbox_targets = self.bbox_coder.encode(
                     sampling_result.pos_bboxes, sampling_result.pos_gt_bboxes)
             else:
                 pos_bbox_targets = sampling_result.pos_gt_bboxes
-            bbox_targets[pos_inds, :] = pos_bbox_targets
-            bbox_weights[pos_inds, :] = 1.0
-            if gt_labels is None:
-                # only rpn gives gt_labels as None, this time FG is 1
-                labels[pos_inds] = 1
-            else:
-                labels[pos_inds] = gt_labels[
-                    sampling_result.pos_assigned_gt_inds]
-            if self.train_cfg.pos_weight <= 0:
-                label_weights[pos_inds] = 1.0
-            else:
-                label_weights[pos_inds] = self.train_cfg.pos_weight
-        if len(neg_inds) > 0:
-            label_weights[neg_inds] = 1.0
+        else:
+            pos_bbox_targets = anchors.new_zeros((0, 4))
+        if gt_labels is None:
+            # only rpn gives gt_labels as None, this time FG is 1
+            pos_labels = pos_inds.new_ones(pos_inds.size())
+        else:
+            pos_labels = gt_labels[sampling_result.pos_assigned_gt_inds]
+
+        # map sample indices back to the original set of anchors
+        return (inside_inds[pos_inds], inside_inds[sampling_result.neg_inds],
+                pos_labels, pos_bbox_targets, sampling_result)
+
+    def _get_batch_samples(self,
+                           anchor_list,
+                           valid_flag_list,
+                           gt_bboxes_list,
+                           img_metas,
+                           gt_bboxes_ignore_list=None,
+                           gt_labels_list=None,
+                           gt_masks_list=None,
+                           label_channels=1):
+        """Assign and sample the anchors of all images.
+
+        Assignment and sampling are done per image, while the dense labels
+        of all images are allocated once with shape (num_imgs, num_anchors)
+        and filled by a single scatter over the flattened batch. This is
+        shared by func:``get_targets`` and func:``get_ohem_targets``.
 
-        # map up to original set of anchors
-        if unmap_outputs:
-            num_total_anchors = flat_anchors.size(0)
-            labels = unmap(
-                labels,
-                num_total_anchors,
-                inside_flags,
-                fill=self.background_label)  # fill bg label
-            label_weights = unmap(label_weights, num_total_anchors,
-                                  inside_flags)
-            bbox_targets = unmap(bbox_targets, num_total_anchors, inside_flags)
-            bbox_weights = unmap(bbox_weights, num_total_anchors, inside_flags)
-
-        return (labels, label_weights, bbox_targets, bbox_weights, pos_inds,
-                neg_inds, sampling_result)
+        Returns:
+            tuple | None: None if an image has no valid anchors, otherwise:
+                batch_anchors (Tensor): Anchors of all levels concatenated
+                    for each image, with shape (num_imgs, num_anchors, 4).
+                all_labels (Tensor): Labels of all images with shape
+                    (num_imgs, num_anchors).
+                all_label_weights (Tensor): Label weights of all images with
+                    shape (num_imgs, num_anchors).
+                flat_pos_inds (Tensor): Indices of the positive anchors in
+                    the flattened batch.
+                pos_inds_list (list[Tensor]): Indices of the positive anchors
+                    of each image, with shape (num_pos, ).
+                pos_bbox_targets_list (list[Tensor]): BBox targets of the
+                    positive anchors of each image, with shape (num_pos, 4).
+                num_total_pos (int): Number of positive samples in all images
+                num_total_neg (int): Number of negative samples in all images
+                sampling_results_list (list[:obj:``SamplingResult``]):
+                    Sampler results of each image.
+        """
+        num_imgs = len(img_metas)
+        assert len(anchor_list) == len(valid_flag_list) == num_imgs
+
+        # anchor number of multi levels
+        num_level_anchors = [anchors.size(0) for anchors in anchor_list[0]]
+        num_level_anchors_list = [num_level_anchors] * num_imgs
+
+        # concat all level anchors of all images to a single tensor
+        concat_anchor_list = []
+        concat_valid_flag_list = []
+        for i in range(num_imgs):
+            assert len(anchor_list[i]) == len(valid_flag_list[i])
+            concat_anchor_list.append(torch.cat(anchor_list[i]))
+            concat_valid_flag_list.append(torch.cat(valid_flag_list[i]))
+        batch_anchors = torch.stack(concat_anchor_list)
+        batch_inside_flags = self.get_batch_inside_flags(
+            batch_anchors, torch.stack(concat_valid_flag_list), img_metas)
+        # no valid anchors
+        if not batch_inside_flags.any(dim=1).all():
+            return None
+
+        # assign and sample each image
+        if gt_bboxes_ignore_list is None:
+            gt_bboxes_ignore_list = [None for _ in range(num_imgs)]
+        if gt_labels_list is None:
+            gt_labels_list = [None for _ in range(num_imgs)]
+        if gt_masks_list is None:
+            gt_masks_list = [None for _ in range(num_imgs)]
+        (pos_inds_list, neg_inds_list, pos_labels_list, pos_bbox_targets_list,
+         sampling_results_list) = multi_apply(
+             self._get_targets_single,
+             batch_anchors,
+             batch_inside_flags,
+             num_level_anchors_list,
+             gt_bboxes_list,
+             gt_bboxes_ignore_list,
+             gt_labels_list,
+             gt_masks_list,
+             img_metas,
+             label_channels=label_channels)
+        # sampled anchors of all images
+        num_total_pos = sum([max(inds.numel(), 1) for inds in pos_inds_list])
+        num_total_neg = sum([max(inds.numel(), 1) for inds in neg_inds_list])
+
+        # write the samples of all images into the flattened batch at once
+        num_total_anchors = batch_anchors.size(1)
+        flat_pos_inds = torch.cat([
+            inds + i * num_total_anchors
+            for i, inds in enumerate(pos_inds_list)
+        ])
+        flat_neg_inds = torch.cat([
+            inds + i * num_total_anchors
+            for i, inds in enumerate(neg_inds_list)
+        ])
+        all_labels = batch_anchors.new_full((num_imgs, num_total_anchors),
+                                            self.background_label,
+                                            dtype=torch.long)
+        all_label_weights = batch_anchors.new_zeros(
+            (num_imgs, num_total_anchors), dtype=torch.float)
+        all_labels.view(-1)[flat_pos_inds] = torch.cat(pos_labels_list)
+        if self.train_cfg.pos_weight <= 0:
+            all_label_weights.view(-1)[flat_pos_inds] = 1.0
+        else:
+            all_label_weights.view(-1)[flat_pos_inds] = \
+                self.train_cfg.pos_weight
+        all_label_weights.view(-1)[flat_neg_inds] = 1.0
+        return (batch_anchors, all_labels, all_label_weights, flat_pos_inds,
+                pos_inds_list, pos_bbox_targets_list, num_total_pos,
+                num_total_neg, sampling_results_list)
 
     def get_targets(self,
                     anchor_list,
@@ -265,6 +469,10 @@ class YOLACTHead(AnchorHead):
         """Compute regression and classification targets for anchors in
             multiple images.
 
+        The dense targets of all images are allocated once with shape
+        (num_imgs, num_anchors) and filled by a single scatter over the
+        flattened batch, see func:``_get_batch_samples``.
+
         Args:
             anchor_list (list[list[Tensor]]): Multi level anchors of each
                 image. The outer list indicates images, and the inner list
@@ -279,9 +487,13 @@ class YOLACTHead(AnchorHead):
             gt_bboxes_ignore_list (list[Tensor]): Ground truth bboxes to be
                 ignored.
             gt_labels_list (list[Tensor]): Ground truth labels of each box.
+            gt_masks_list (list[Tensor]): Ground truth masks of each image.
             label_channels (int): Channel of label.
-            unmap_outputs (bool): Whether to map outputs back to the original
-                set of anchors.
+            unmap_outputs (bool): Whether to split the targets into levels.
+                If False, the targets of all levels are kept together, each
+                with a leading dimension of num_imgs.
+            return_sampling_results (bool): Whether to return the sampling
+                results of each image.
 
         Returns:
             tuple:
@@ -291,69 +503,96 @@ class YOLACTHead(AnchorHead):
                 bbox_weights_list (list[Tensor]): BBox weights of each level
                 num_total_pos (int): Number of positive samples in all images
                 num_total_neg (int): Number of negative samples in all images
-            additional_returns: This function enables user-defined returns from
-                `self._get_targets_single`. These returns are currently refined
-                to properties at each feature map (i.e. having HxW dimension).
-                The results will be concatenated after the end
-
+                concat_anchors (Tensor): Anchors of all levels concatenated
+                    for each image, with shape (num_imgs, num_anchors, 4).
+                sampling_results_list (list[:obj:``SamplingResult``]):
+                    Sampler results of each image, only returned when
+                    ``return_sampling_results`` is True.
         """
-        num_imgs = len(img_metas)
-        assert len(anchor_list) == len(valid_flag_list) == num_imgs
-
-        # anchor number of multi levels
-        num_level_anchors = [anchors.size(0) for anchors in anchor_list[0]]
-        num_level_anchors_list = [num_level_anchors] * num_imgs
-
-        # concat all level anchors to a single tensor
-        concat_anchor_list = []
-        concat_valid_flag_list = []
-        for i in range(num_imgs):
-            assert len(anchor_list[i]) == len(valid_flag_list[i])
-            concat_anchor_list.append(torch.cat(anchor_list[i]))
-            concat_valid_flag_list.append(torch.cat(valid_flag_list[i]))
-
-        # compute targets for each image
-        if gt_bboxes_ignore_list is None:
-            gt_bboxes_ignore_list = [None for _ in range(num_imgs)]
-        if gt_labels_list is None:
-            gt_labels_list = [None for _ in range(num_imgs)]
-        results = multi_apply(
-            self._get_targets_single,
-            concat_anchor_list,
-            concat_valid_flag_list,
-            num_level_anchors_list,
-            gt_bboxes_list,
-            gt_bboxes_ignore_list,
-            gt_labels_list,
-            gt_masks_list,
-            img_metas,
-            label_channels=label_channels,
-            unmap_outputs=unmap_outputs)
-        (all_labels, all_label_weights, all_bbox_targets, all_bbox_weights,
-         pos_inds_list, neg_inds_list, sampling_results_list) = results[:7]
-        rest_results = list(results[7:])  # user-added return values
-        # no valid anchors
-        if any([labels is None for labels in all_labels]):
+        samples = self._get_batch_samples(
+            anchor_list, valid_flag_list, gt_bboxes_list, img_metas,
+            gt_bboxes_ignore_list, gt_labels_list, gt_masks_list,
+            label_channels)
+        if samples is None:
             return None
-        # sampled anchors of all images
-        num_total_pos = sum([max(inds.numel(), 1) for inds in pos_inds_list])
-        num_total_neg = sum([max(inds.numel(), 1) for inds in neg_inds_list])
-        # split targets to a list w.r.t. multiple levels
-        labels_list = images_to_levels(all_labels, num_level_anchors)
-        label_weights_list = images_to_levels(all_label_weights,
-                                              num_level_anchors)
-        bbox_targets_list = images_to_levels(all_bbox_targets,
-                                             num_level_anchors)
-        bbox_weights_list = images_to_levels(all_bbox_weights,
-                                             num_level_anchors)
-        res = (labels_list, label_weights_list, bbox_targets_list,
-               bbox_weights_list, num_total_pos, num_total_neg)
+        (batch_anchors, all_labels, all_label_weights, flat_pos_inds, _,
+         pos_bbox_targets_list, num_total_pos, num_total_neg,
+         sampling_results_list) = samples
+
+        # the dense box targets and weights share one zeroed buffer, so they
+        # are allocated and cleared only once per batch
+        all_bbox_targets, all_bbox_weights = batch_anchors.new_zeros(
+            (2, ) + batch_anchors.size())
+        all_bbox_targets.view(-1, 4)[flat_pos_inds] = torch.cat(
+            pos_bbox_targets_list)
+        all_bbox_weights.view(-1, 4)[flat_pos_inds] = 1.0
+        targets = (all_labels, all_label_weights, all_bbox_targets,
+                   all_bbox_weights)
+        if unmap_outputs:
+            # split targets to a list w.r.t. multiple levels, the batch is
+            # already stacked so each target is cut into level views at once
+            num_level_anchors = [
+                anchors.size(0) for anchors in anchor_list[0]
+            ]
+            targets = [
+                list(torch.split(target, num_level_anchors, 1))
+                for target in targets
+            ]
+        res = tuple(targets) + (num_total_pos, num_total_neg, batch_anchors)
         if return_sampling_results:
             res = res + (sampling_results_list, )
-        for i, r in enumerate(rest_results):  # user-added return values
-            rest_results[i] = images_to_levels(r, num_level_anchors)
+        return res
+
+    def get_ohem_targets(self,
+                         anchor_list,
+                         valid_flag_list,
+                         gt_bboxes_list,
+                         img_metas,
+                         gt_bboxes_ignore_list=None,
+                         gt_labels_list=None,
+                         gt_masks_list=None,
+                         label_channels=1):
+        """Compute the targets used by func:``loss_single_OHEM``.
+
+        Different from func:``get_targets``, the targets are kept per image
+        over all levels, in the layout of the flattened predictions, and
+        nearly all anchors are negatives, so only the box targets of the
+        positive anchors are returned instead of dense box targets.
 
-        return res + tuple(rest_results)
+        Args:
+            See func:``get_targets``.
+
+        Returns:
+            tuple:
+                labels (Tensor): Labels of all images with shape
+                    (num_imgs, num_anchors).
+                label_weights (Tensor): Label weights of all images with
+                    shape (num_imgs, num_anchors).
+                pos_inds_list (list[Tensor]): Indices of the positive anchors
+                    of each image, with shape (num_pos, ).
+                pos_bbox_targets_list (list[Tensor]): BBox targets of the
+                    positive anchors of each image, with shape (num_pos, 4).
+                num_total_pos (int): Number of positive samples in all images
+                num_total_neg (int): Number of negative samples in all images
+                concat_anchors (Tensor): Anchors of all levels concatenated
+                    for each image, with shape (num_imgs, num_anchors, 4).
+                sampling_results_list (list[:obj:``SamplingResult``]):
+                    Sampler results of each image.
+        """
+        samples = self._get_batch_samples(
+            anchor_list, valid_flag_list, gt_bboxes_list, img_metas,
+            gt_bboxes_ignore_list, gt_labels_list, gt_masks_list,
+            label_channels)
+        if samples is None:
+            return None
+        (batch_anchors, all_labels, all_label_weights, _, pos_inds_list,
+         pos_bbox_targets_list, num_total_pos, num_total_neg,
+         sampling_results_list) = samples
+        # anchors outside the image already have zero label weights, so the
+        # labels are kept on all anchors
+        return (all_labels, all_label_weights, pos_inds_list,
+                pos_bbox_targets_list, num_total_pos, num_total_neg,
+                batch_anchors, sampling_results_list)
 
     @force_fp32(apply_to=('cls_scores', 'bbox_preds'))
     def loss(self,
@@ -394,51 +633,26 @@ class YOLACTHead(AnchorHead):
         anchor_list, valid_flag_list = self.get_anchors(
             featmap_sizes, img_metas, device=device)
         label_channels = self.cls_out_channels if self.use_sigmoid_cls else 1
-        cls_reg_targets = self.get_targets(
-            anchor_list,
-            valid_flag_list,
-            gt_bboxes,
-            img_metas,
-            gt_bboxes_ignore_list=gt_bboxes_ignore,
-            gt_labels_list=gt_labels,
-            gt_masks_list=gt_masks,
-            label_channels=label_channels,
-            unmap_outputs=not self.use_ohem,
-            # unmap_outputs=True,
-            return_sampling_results=True)
-        if cls_reg_targets is None:
-            return None
-        (labels_list, label_weights_list, bbox_targets_list, bbox_weights_list,
-         num_total_pos, num_total_neg, sampling_results) = cls_reg_targets
-
         if self.use_ohem:
-            num_images = len(img_metas)
-            all_cls_scores = torch.cat([
-                s.permute(0, 2, 3, 1).reshape(
-                    num_images, -1, self.cls_out_channels) for s in cls_scores
-            ], 1)
-            all_labels = torch.cat(labels_list, -1).view(num_images, -1)
-            all_label_weights = torch.cat(label_weights_list,
-                                          -1).view(num_images, -1)
-            all_bbox_preds = torch.cat([
-                b.permute(0, 2, 3, 1).reshape(num_images, -1, 4)
-                for b in bbox_preds
-            ], -2)
-            all_bbox_targets = torch.cat(bbox_targets_list,
-                                         -2).view(num_images, -1, 4)
-            all_bbox_weights = torch.cat(bbox_weights_list,
-                                         -2).view(num_images, -1, 4)
-
-            # concat all level anchors to a single tensor
-            all_anchors = []
-            for i in range(num_images):
-                all_anchors.append(torch.cat(anchor_list[i]))
-
-            # check NaN and Inf
-            assert torch.isfinite(all_cls_scores).all().item(), \
-                'classification scores become infinite or NaN!'
-            assert torch.isfinite(all_bbox_preds).all().item(), \
-                'bbox predications become infinite or NaN!'
+            ohem_targets = self.get_ohem_targets(
+                anchor_list,
+                valid_flag_list,
+                gt_bboxes,
+                img_metas,
+                gt_bboxes_ignore_list=gt_bboxes_ignore,
+                gt_labels_list=gt_labels,
+                gt_masks_list=gt_masks,
+                label_channels=label_channels)
+            if ohem_targets is None:
+                return None
+            (all_labels, all_label_weights, pos_inds_list,
+             pos_bbox_targets_list, num_total_pos, num_total_neg, all_anchors,
+             sampling_results) = ohem_targets
+
+            # the targets are already laid out per image over all levels
+            all_cls_scores = self._flatten_level_preds(
+                cls_scores, self.cls_out_channels)
+            all_bbox_preds = self._flatten_level_preds(bbox_preds, 4)
 
             losses_cls, losses_bbox = multi_apply(
                 self.loss_single_OHEM,
@@ -447,22 +661,33 @@ class YOLACTHead(AnchorHead):
                 all_anchors,
                 all_labels,
                 all_label_weights,
-                all_bbox_targets,
-                all_bbox_weights,
+                pos_bbox_targets_list,
+                pos_inds_list,
                 num_total_samples=num_total_pos)
         else:
+            cls_reg_targets = self.get_targets(
+                anchor_list,
+                valid_flag_list,
+                gt_bboxes,
+                img_metas,
+                gt_bboxes_ignore_list=gt_bboxes_ignore,
+                gt_labels_list=gt_labels,
+                gt_masks_list=gt_masks,
+                label_channels=label_channels,
+                return_sampling_results=True)
+            if cls_reg_targets is None:
+                return None
+            (labels_list, label_weights_list, bbox_targets_list,
+             bbox_weights_list, num_total_pos, num_total_neg, all_anchors,
+             sampling_results) = cls_reg_targets
+
             num_total_samples = (
                 num_total_pos +
                 num_total_neg if self.sampling else num_total_pos)
 
             # anchor number of multi levels
             num_level_anchors = [anchors.size(0) for anchors in anchor_list[0]]
-            # concat all level anchors and flags to a single tensor
-            concat_anchor_list = []
-            for i in range(len(anchor_list)):
-                concat_anchor_list.append(torch.cat(anchor_list[i]))
-            all_anchor_list = images_to_levels(concat_anchor_list,
-                                               num_level_anchors)
+            all_anchor_list = torch.split(all_anchors, num_level_anchors, 1)
             losses_cls, losses_bbox = multi_apply(
                 self.loss_single,
                 cls_scores,
@@ -477,38 +702,75 @@ class YOLACTHead(AnchorHead):
         return dict(
             loss_cls=losses_cls, loss_bbox=losses_bbox), sampling_results
 
+    def _flatten_level_preds(self, preds, channels, dtype=None):
+        """Flatten multi-level predictions into a single tensor.
+
+        Each level is copied straight from (N, num_anchors * C, H, W) into its
+        slice of a preallocated output, instead of materializing a permuted
+        copy per level and concatenating them afterwards.
+
+        Args:
+            preds (list[Tensor]): Predictions of each scale level with shape
+                (N, num_anchors * C, H, W).
+            channels (int): Number of channels ``C`` per anchor.
+            dtype (torch.dtype, optional): Data type of the output. The cast
+                is done by the same copy. Defaults to the type of ``preds``.
+
+        Returns:
+            Tensor: Flattened predictions with shape (N, num_total_anchors, C).
+        """
+        num_imgs = preds[0].size(0)
+        num_level_preds = [p[0].numel() // channels for p in preds]
+        flat_preds = preds[0].new_empty(
+            (num_imgs, sum(num_level_preds), channels),
+            dtype=preds[0].dtype if dtype is None else dtype)
+        start = 0
+        for p, n in zip(preds, num_level_preds):
+            _, c, h, w = p.size()
+            flat_preds[:, start:start + n].view(num_imgs, h, w, c).copy_(
+                p.permute(0, 2, 3, 1))
+            start += n
+        return flat_preds
+
     def loss_single_OHEM(self, cls_score, bbox_pred, anchors, labels,
-                         label_weights, bbox_targets, bbox_weights,
+                         label_weights, pos_bbox_targets, pos_inds,
                          num_total_samples):
-        """"See func:``SSDHead.loss``."""
+        """"See func:``SSDHead.loss``. Different from it, the box loss is
+        computed on the positive anchors given by ``pos_inds`` only."""
         loss_cls_all = self.loss_cls(cls_score, labels, label_weights)
 
         # FG cat_id: [0, num_classes -1], BG cat_id: num_classes
-        pos_inds = ((labels >= 0) &
-                    (labels < self.background_label)).nonzero().reshape(-1)
-        neg_inds = (labels == self.background_label).nonzero().view(-1)
+        fg_mask = (labels >= 0) & (labels < self.background_label)
+        neg_mask = labels == self.background_label
 
-        num_pos_samples = pos_inds.size(0)
+        num_pos_samples, num_neg_candidates = torch.stack(
+            [fg_mask.sum(), neg_mask.sum()]).tolist()
         if num_pos_samples == 0:
-            num_neg_samples = neg_inds.size(0)
+            num_neg_samples = num_neg_candidates
         else:
-            num_neg_samples = self.train_cfg.neg_pos_ratio * num_pos_samples
-            if num_neg_samples > neg_inds.size(0):
-                num_neg_samples = neg_inds.size(0)
-        topk_loss_cls_neg, _ = loss_cls_all[neg_inds].topk(num_neg_samples)
-        loss_cls_pos = loss_cls_all[pos_inds].sum()
+            num_neg_samples = min(
+                self.train_cfg.neg_pos_ratio * num_pos_samples,
+                num_neg_candidates)
+        # mine hard negatives in place instead of gathering the negative set
+        neg_loss_cls_all = loss_cls_all.masked_fill(~neg_mask, float('-inf'))
+        topk_loss_cls_neg, _ = neg_loss_cls_all.topk(num_neg_samples)
+        loss_cls_pos = torch.where(fg_mask, loss_cls_all,
+                                   loss_cls_all.new_zeros(())).sum()
         loss_cls_neg = topk_loss_cls_neg.sum()
         loss_cls = (loss_cls_pos + loss_cls_neg) / num_total_samples
-        if self.reg_decoded_bbox:
-            bbox_pred = self.bbox_coder.decode(anchors, bbox_pred)
-        loss_bbox = self.loss_bbox(
-            bbox_pred,
-            bbox_targets,
-            bbox_weights,
-            avg_factor=num_total_samples)
+        if len(pos_inds) > 0:
+            pos_bbox_pred = bbox_pred[pos_inds]
+            if self.reg_decoded_bbox:
+                pos_bbox_pred = self.bbox_coder.decode(anchors[pos_inds],
+                                                       pos_bbox_pred)
+            loss_bbox = self.loss_bbox(
+                pos_bbox_pred,
+                pos_bbox_targets,
+                avg_factor=num_total_samples)
+        else:
+            loss_bbox = bbox_pred.sum() * 0
         return loss_cls[None], loss_bbox
 
-    @force_fp32(apply_to=('cls_scores', 'bbox_preds', 'coeff_preds'))
     def get_bboxes(self,
                    cls_scores,
                    bbox_preds,
@@ -547,54 +809,66 @@ class YOLACTHead(AnchorHead):
 
         device = cls_scores[0].device
         featmap_sizes = [cls_scores[i].shape[-2:] for i in range(num_levels)]
-        mlvl_anchors = self.anchor_generator.grid_anchors(
-            featmap_sizes, device=device)
+        mlvl_anchors = self.get_grid_anchors(featmap_sizes, device=device)
+
+        # flatten the levels of all images in one pass, which also casts the
+        # predictions to fp32 instead of a separate cast of every level
+        level_preds = [(cls_scores, self.cls_out_channels), (bbox_preds, 4),
+                       (coeff_preds, self.num_protos)]
+        flat_cls_scores, flat_bbox_preds, flat_coeff_preds = [
+            self._flatten_level_preds([pred.detach() for pred in preds],
+                                      channels,
+                                      dtype=torch.float)
+            for preds, channels in level_preds
+        ]
+
+        # upload the scale factors of all images at once rather than one
+        # small host to device copy per image
+        scale_factors = torch.from_numpy(
+            np.array([img_meta['scale_factor'] for img_meta in img_metas],
+                     dtype=np.float32))
+        if scale_factors.device != device:
+            scale_factors = scale_factors.pin_memory().to(
+                device, non_blocking=True)
 
         result_list = []
         for img_id in range(len(img_metas)):
-            cls_score_list = [
-                cls_scores[i][img_id].detach() for i in range(num_levels)
-            ]
-            bbox_pred_list = [
-                bbox_preds[i][img_id].detach() for i in range(num_levels)
-            ]
-            coeff_pred_list = [
-                coeff_preds[i][img_id].detach() for i in range(num_levels)
-            ]
             img_shape = img_metas[img_id]['img_shape']
-            scale_factor = img_metas[img_id]['scale_factor']
-            proposals = self._get_bboxes_single(cls_score_list, bbox_pred_list,
-                                                coeff_pred_list, mlvl_anchors,
-                                                img_shape, scale_factor, cfg,
-                                                rescale)
+            scale_factor = scale_factors[img_id]
+            proposals = self._get_bboxes_single(flat_cls_scores[img_id],
+                                                flat_bbox_preds[img_id],
+                                                flat_coeff_preds[img_id],
+                                                mlvl_anchors, img_shape,
+                                                scale_factor, cfg, rescale)
             result_list.append(proposals)
         return result_list
 
     def _get_bboxes_single(self,
-                           cls_score_list,
-                           bbox_pred_list,
-                           coeff_preds_list,
+                           cls_score,
+                           bbox_pred,
+                           coeff_pred,
                            mlvl_anchors,
                            img_shape,
                            scale_factor,
                            cfg,
                            rescale=False):
         """"Similiar to func:``AnchorHead._get_bboxes_single``, but
-        additionally processes coeff_preds_list and uses fast NMS instead of
+        additionally processes coeff_pred and uses fast NMS instead of
         traditional NMS.
         Args:
-            cls_score_list (list[Tensor]): Box scores for a single scale level
-                Has shape (num_anchors * num_classes, H, W).
-            bbox_pred_list (list[Tensor]): Box energies / deltas for a single
-                scale level with shape (num_anchors * 4, H, W).
-            coeff_preds_list (list[Tensor]): Mask coefficients for a single
-                scale level with shape (num_anchors * num_protos, H, W).
-            mlvl_anchors (list[Tensor]): Box reference for a single scale level
+            cls_score (Tensor): Box scores of all scale levels with shape
+                (num_total_anchors, num_classes).
+            bbox_pred (Tensor): Box energies / deltas of all scale levels
                 with shape (num_total_anchors, 4).
+            coeff_pred (Tensor): Mask coefficients of all scale levels with
+                shape (num_total_anchors, num_protos).
+            mlvl_anchors (list[Tensor]): Box reference for a single scale level
+                with shape (num_anchors, 4).
             img_shape (tuple[int]): Shape of the input image,
                 (height, width, 3).
-            scale_factor (ndarray): Scale factor of the image arange as
-                (w_scale, h_scale, w_scale, h_scale).
+            scale_factor (Tensor): Scale factor of the image arange as
+                (w_scale, h_scale, w_scale, h_scale), on the device of the
+                predictions.
             cfg (mmcv.Config): Test / postprocessing configuration,
                 if None, test_cfg would be used.
             rescale (bool): If True, return boxes in original image space.
@@ -609,54 +883,56 @@ class YOLACTHead(AnchorHead):
                 corresponding box.
         """
         cfg = self.test_cfg if cfg is None else cfg
-        assert len(cls_score_list) == len(bbox_pred_list) == len(mlvl_anchors)
-        mlvl_bboxes = []
-        mlvl_scores = []
-        mlvl_coeffs = []
-        for cls_score, bbox_pred, coeff_pred, anchors in \
-                zip(cls_score_list, bbox_pred_list,
-                    coeff_preds_list, mlvl_anchors):
-            assert cls_score.size()[-2:] == bbox_pred.size()[-2:]
-            cls_score = cls_score.permute(1, 2,
-                                          0).reshape(-1, self.cls_out_channels)
+        assert cls_score.size(0) == bbox_pred.size(0) == coeff_pred.size(0)
+        num_level_preds = [anchors.size(0) for anchors in mlvl_anchors]
+        # process all levels at once rather than level by level
+        if self.use_sigmoid_cls:
+            mlvl_scores = cls_score.sigmoid()
+        else:
+            mlvl_scores = cls_score.softmax(-1)
+        mlvl_coeffs = coeff_pred
+        anchors = torch.cat(mlvl_anchors)
+        nms_pre = cfg.get('nms_pre', -1)
+        if nms_pre > 0 and max(num_level_preds) > nms_pre:
+            # Get maximum scores for foreground classes.
             if self.use_sigmoid_cls:
-                scores = cls_score.sigmoid()
+                max_scores, _ = mlvl_scores.max(dim=1)
             else:
-                scores = cls_score.softmax(-1)
-            bbox_pred = bbox_pred.permute(1, 2, 0).reshape(-1, 4)
-            coeff_pred = coeff_pred.permute(1, 2,
-                                            0).reshape(-1, self.num_protos)
-            nms_pre = cfg.get('nms_pre', -1)
-            if nms_pre > 0 and scores.shape[0] > nms_pre:
-                # Get maximum scores for foreground classes.
-                if self.use_sigmoid_cls:
-                    max_scores, _ = scores.max(dim=1)
+                # remind that we set FG labels to [0, num_class-1]
+                # since mmdet v2.0
+                # BG cat_id: num_class
+                max_scores, _ = mlvl_scores[:, :-1].max(dim=1)
+            # keep the top nms_pre predictions of each level
+            topk_inds = []
+            start = 0
+            for num_preds in num_level_preds:
+                if num_preds > nms_pre:
+                    _, inds = max_scores[start:start + num_preds].topk(nms_pre)
+                    topk_inds.append(inds + start)
                 else:
-                    # remind that we set FG labels to [0, num_class-1]
-                    # since mmdet v2.0
-                    # BG cat_id: num_class
-                    max_scores, _ = scores[:, :-1].max(dim=1)
-                _, topk_inds = max_scores.topk(nms_pre)
-                anchors = anchors[topk_inds, :]
-                bbox_pred = bbox_pred[topk_inds, :]
-                scores = scores[topk_inds, :]
-                coeff_pred = coeff_pred[topk_inds, :]
-            bboxes = self.bbox_coder.decode(
-                anchors, bbox_pred, max_shape=img_shape)
-            mlvl_bboxes.append(bboxes)
-            mlvl_scores.append(scores)
-            mlvl_coeffs.append(coeff_pred)
-        mlvl_bboxes = torch.cat(mlvl_bboxes)
+                    topk_inds.append(
+                        torch.arange(
+                            start, start + num_preds,
+                            device=max_scores.device))
+                start += num_preds
+            topk_inds = torch.cat(topk_inds)
+            anchors = anchors[topk_inds, :]
+            bbox_pred = bbox_pred[topk_inds, :]
+            mlvl_scores = mlvl_scores[topk_inds, :]
+            mlvl_coeffs = mlvl_coeffs[topk_inds, :]
+        mlvl_bboxes = self.bbox_coder.decode(
+            anchors, bbox_pred, max_shape=img_shape)
         if rescale:
-            mlvl_bboxes /= mlvl_bboxes.new_tensor(scale_factor)
-        mlvl_scores = torch.cat(mlvl_scores)
-        mlvl_coeffs = torch.cat(mlvl_coeffs)
+            mlvl_bboxes /= scale_factor
         if self.use_sigmoid_cls:
             # Add a dummy background class to the backend when using sigmoid
             # remind that we set FG labels to [0, num_class-1] since mmdet v2.0
             # BG cat_id: num_class
-            padding = mlvl_scores.new_zeros(mlvl_scores.shape[0], 1)
-            mlvl_scores = torch.cat([mlvl_scores, padding], dim=1)
+            num_preds, num_classes = mlvl_scores.size()
+            padded_scores = mlvl_scores.new_empty((num_preds, num_classes + 1))
+            padded_scores[:, :num_classes] = mlvl_scores
+            padded_scores[:, num_classes] = 0
+            mlvl_scores = padded_scores
         det_bboxes, det_labels, det_coeffs = fast_nms(mlvl_bboxes, mlvl_scores,
                                                       mlvl_coeffs,
                                                       cfg.score_thr,
@@ -719,7 +995,8 @@ class YOLACTSegmHead(nn.Module):
             segm_pred (list[Tensor]): Predicted semantic segmentation map
                 with shape (N, num_classes, H, W).
             gt_masks (list[Tensor]): Ground truth masks for each image with
-                the same shape of the input image.
+                the same shape of the input image, or binary masks already
+                downsampled to (H, W).
             gt_labels (list[Tensor]): Class indices corresponding to each box.
         Returns:
             dict[str, Tensor]: A dictionary of loss components.
@@ -733,9 +1010,9 @@ class YOLACTSegmHead(nn.Module):
             segm_targets = self.get_targets(cur_segm_pred, cur_gt_masks,
                                             cur_gt_labels)
             if segm_targets is None:
-                loss = self.loss_segm(cur_segm_pred,
-                                      torch.zeros_like(cur_segm_pred),
-                                      torch.zeros_like(cur_segm_pred))
+                # all-zero weights give a zero loss, so skip the full-sized
+                # target and weight buffers
+                loss = cur_segm_pred.sum() * 0.
             else:
                 loss = self.loss_segm(
                     cur_segm_pred,
@@ -750,7 +1027,8 @@ class YOLACTSegmHead(nn.Module):
             segm_pred (Tensor): Predicted semantic segmentation map
                 with shape (num_classes, H, W).
             gt_masks (Tensor): Ground truth masks for each image with
-                the same shape of the input image.
+                the same shape of the input image, or binary masks already
+                downsampled to (H, W).
             gt_labels (Tensor): Class indices corresponding to each box.
         Returns:
             Tensor: Semantic segmentation targets with shape
@@ -760,17 +1038,22 @@ class YOLACTSegmHead(nn.Module):
             return None
         num_classes, mask_h, mask_w = segm_pred.size()
         with torch.no_grad():
-            downsampled_masks = F.interpolate(
-                gt_masks.unsqueeze(0), (mask_h, mask_w),
-                mode='bilinear',
-                align_corners=False).squeeze(0)
-            downsampled_masks = downsampled_masks.gt(0.5).float()
+            if gt_masks.shape[-2:] == (mask_h, mask_w):
+                # the masks are already downsampled and binarized
+                downsampled_masks = gt_masks
+            else:
+                downsampled_masks = F.interpolate(
+                    gt_masks.unsqueeze(0), (mask_h, mask_w),
+                    mode='bilinear',
+                    align_corners=False).squeeze(0)
+                downsampled_masks = downsampled_masks.gt(0.5).float()
             segm_targets = torch.zeros_like(segm_pred, requires_grad=False)
-            for obj_idx in range(downsampled_masks.size(0)):
-                segm_targets[gt_labels[obj_idx] - 1] = torch.max(
-                    segm_targets[gt_labels[obj_idx] - 1],
-                    downsampled_masks[obj_idx])
-            return segm_targets
+            # the masks are binary, so the max over the objects of a class is
+            # their sum clamped to 1, which is accumulated for all objects at
+            # once; labels are wrapped the same as negative indexing would
+            segm_targets.index_add_(0, (gt_labels - 1) % num_classes,
+                                    downsampled_masks)
+            return segm_targets.clamp_(max=1)
 
 
 @HEADS.register_module()
@@ -788,6 +1071,10 @@ class YOLACTProtonet(nn.Module):
         loss_mask_weight (float): Reweight the mask loss by this factor.
         max_masks_to_train (int): Maximum number of masks to train for
             each image.
+        channels_last (bool): If True, run the protonet in the channels last
+            memory format, which is faster with tensor cores. It needs a
+            PyTorch with ``torch.channels_last`` and is ignored otherwise.
+            Default: False.
     """
 
     def __init__(self,
@@ -798,19 +1085,26 @@ class YOLACTProtonet(nn.Module):
                  include_last_relu=True,
                  num_protos=32,
                  loss_mask_weight=1.0,
-                 max_masks_to_train=100):
+                 max_masks_to_train=100,
+                 channels_last=False):
         super(YOLACTProtonet, self).__init__()
         self.in_channels = in_channels
         self.proto_channels = proto_channels
         self.proto_kernel_sizes = proto_kernel_sizes
         self.include_last_relu = include_last_relu
         self.protonet = self._init_layers()
+        self.channels_last = channels_last and hasattr(torch, 'channels_last')
+        if self.channels_last:
+            self.protonet.to(memory_format=torch.channels_last)
 
         self.loss_mask_weight = loss_mask_weight
         self.num_protos = num_protos
         self.num_classes = num_classes
         self.max_masks_to_train = max_masks_to_train
         self.fp16_enabled = False
+        # pixel coordinates of the latest size used by ``crop``, keyed by
+        # device, dtype and size
+        self._arange_cache = {}
 
     def _init_layers(self):
         """A helper function to take a config setting and turn it into a
@@ -855,6 +1149,7 @@ class YOLACTProtonet(nn.Module):
             if isinstance(m, nn.Conv2d):
                 xavier_init(m, distribution='uniform')
 
+    @auto_fp16(apply_to=('x', 'coeff_pred'))
     def forward(self, x, coeff_pred, bboxes, img_meta, sampling_results=None):
         """Forward feature from the upstream network to get prototypes and
         linearly combine the prototypes, using masks coefficients, into
@@ -875,7 +1170,10 @@ class YOLACTProtonet(nn.Module):
         Returns:
             list[Tensor]: Predicted instance segmentation masks.
         """
+        if self.channels_last:
+            x = x.contiguous(memory_format=torch.channels_last)
         prototypes = self.protonet(x)
+        # no copy is needed if the prototypes are already channels last
         prototypes = prototypes.permute(0, 2, 3, 1).contiguous()
 
         num_imgs = x.size(0)
@@ -889,6 +1187,17 @@ class YOLACTProtonet(nn.Module):
                 coeff_pred_list.append(coeff_pred_per_level)
             coeff_pred = torch.cat(coeff_pred_list, dim=1)
 
+        batch_mask_pred = None
+        if not self.training and len(
+                set(cur_coeff.size(0) for cur_coeff in coeff_pred)) == 1:
+            # all images have the same number of detections, so the
+            # prototypes of all images are combined in one batched matmul
+            _, proto_h, proto_w, _ = prototypes.size()
+            batch_mask_pred = torch.bmm(
+                prototypes.view(num_imgs, proto_h * proto_w, -1),
+                torch.stack(coeff_pred).transpose(1, 2)).view(
+                    num_imgs, proto_h, proto_w, -1)
+
         mask_pred_list = []
         for idx in range(num_imgs):
             cur_prototypes = prototypes[idx]
@@ -903,21 +1212,24 @@ class YOLACTProtonet(nn.Module):
                 cur_sampling_results = sampling_results[idx]
                 pos_assigned_gt_inds = \
                     cur_sampling_results.pos_assigned_gt_inds
-                bboxes_for_cropping = cur_bboxes[pos_assigned_gt_inds].clone()
+                bboxes_for_cropping = cur_bboxes[pos_assigned_gt_inds]
                 pos_inds = cur_sampling_results.pos_inds
                 cur_coeff_pred = cur_coeff_pred[pos_inds]
 
             # Linearly combine the prototypes with the mask coefficients
-            mask_pred = cur_prototypes @ cur_coeff_pred.t()
-            mask_pred = torch.sigmoid(mask_pred)
+            if batch_mask_pred is not None:
+                mask_pred = batch_mask_pred[idx]
+            else:
+                mask_pred = cur_prototypes @ cur_coeff_pred.t()
 
+            # out of place, so the boxes of the caller are left untouched;
+            # predicted boxes at test time carry a trailing score column
             h, w = cur_img_meta['img_shape'][:2]
-            bboxes_for_cropping[:, 0] /= w
-            bboxes_for_cropping[:, 1] /= h
-            bboxes_for_cropping[:, 2] /= w
-            bboxes_for_cropping[:, 3] /= h
+            bboxes_for_cropping = bboxes_for_cropping[:, :4] / \
+                bboxes_for_cropping.new_tensor([w, h, w, h])
 
-            mask_pred = self.crop(mask_pred, bboxes_for_cropping)
+            mask_pred = self.crop(
+                mask_pred, bboxes_for_cropping, with_sigmoid=True)
             mask_pred = mask_pred.permute(2, 0, 1).contiguous()
             mask_pred_list.append(mask_pred)
         return mask_pred_list
@@ -939,9 +1251,14 @@ class YOLACTProtonet(nn.Module):
         Returns:
             dict[str, Tensor]: A dictionary of loss components.
         """
-        loss_mask = []
         num_imgs = len(mask_pred)
         total_pos = 0
+        # the positive masks of all images share the same size, so they are
+        # gathered and the bce loss of the whole batch is computed at once
+        num_pos_list = []
+        pos_mask_pred_list = []
+        mask_targets_list = []
+        reweight_list = []
         for idx in range(num_imgs):
             cur_mask_pred = mask_pred[idx]
             cur_gt_masks = gt_masks[idx].float()
@@ -955,38 +1272,47 @@ class YOLACTProtonet(nn.Module):
             # it'd take too much vram to backprop on every single mask.
             # Thus we select only a subset.
             if num_pos > self.max_masks_to_train:
-                perm = torch.randperm(num_pos)
+                perm = torch.randperm(num_pos, device=cur_mask_pred.device)
                 select = perm[:self.max_masks_to_train]
                 cur_mask_pred = cur_mask_pred[select]
                 pos_assigned_gt_inds = pos_assigned_gt_inds[select]
                 num_pos = self.max_masks_to_train
             total_pos += num_pos
 
-            gt_bboxes_for_reweight = cur_gt_bboxes[pos_assigned_gt_inds]
-
             mask_targets = self.get_targets(cur_mask_pred, cur_gt_masks,
                                             pos_assigned_gt_inds)
-            if num_pos == 0:
-                loss = cur_mask_pred.sum() * 0.
-            elif mask_targets is None:
-                loss = F.binary_cross_entropy(cur_mask_pred,
-                                              torch.zeros_like(cur_mask_pred),
-                                              torch.zeros_like(cur_mask_pred))
-            else:
-                cur_mask_pred = torch.clamp(cur_mask_pred, 0, 1)
-                loss = F.binary_cross_entropy(
-                    cur_mask_pred, mask_targets,
-                    reduction='none') * self.loss_mask_weight
-
-                h, w = cur_img_meta['img_shape'][:2]
-                gt_bboxes_width = (gt_bboxes_for_reweight[:, 2] -
-                                   gt_bboxes_for_reweight[:, 0]) / w
-                gt_bboxes_height = (gt_bboxes_for_reweight[:, 3] -
-                                    gt_bboxes_for_reweight[:, 1]) / h
-                loss = loss.mean(dim=(1,
-                                      2)) / gt_bboxes_width / gt_bboxes_height
-                loss = torch.sum(loss)
-            loss_mask.append(loss)
+            if num_pos == 0 or mask_targets is None:
+                num_pos_list.append(0)
+                continue
+            num_pos_list.append(num_pos)
+            pos_mask_pred_list.append(cur_mask_pred)
+            mask_targets_list.append(mask_targets)
+
+            gt_bboxes_for_reweight = cur_gt_bboxes[pos_assigned_gt_inds]
+            h, w = cur_img_meta['img_shape'][:2]
+            gt_bboxes_width = (gt_bboxes_for_reweight[:, 2] -
+                               gt_bboxes_for_reweight[:, 0]) / w
+            gt_bboxes_height = (gt_bboxes_for_reweight[:, 3] -
+                                gt_bboxes_for_reweight[:, 1]) / h
+            reweight_list.append(gt_bboxes_width * gt_bboxes_height)
+
+        if len(pos_mask_pred_list) > 0:
+            pos_mask_pred = torch.clamp(torch.cat(pos_mask_pred_list), 0, 1)
+            loss = F.binary_cross_entropy(
+                pos_mask_pred, torch.cat(mask_targets_list),
+                reduction='none') * self.loss_mask_weight
+            loss = loss.mean(dim=(1, 2)) / torch.cat(reweight_list)
+            pos_loss_list = torch.split(loss, num_pos_list)
+        else:
+            pos_loss_list = [None] * num_imgs
+
+        # images without positive masks still get a zero loss connected to
+        # their predictions
+        loss_mask = [
+            pos_loss.sum() if num_pos > 0 else mask_pred[idx].sum() * 0.
+            for idx, (pos_loss, num_pos) in enumerate(
+                zip(pos_loss_list, num_pos_list))
+        ]
 
         if total_pos == 0:
             total_pos += 1  # avoid nan
@@ -1000,7 +1326,8 @@ class YOLACTProtonet(nn.Module):
             mask_pred (Tensor): Predicted prototypes with shape
                 (num_classes, H, W).
             gt_masks (Tensor): Ground truth masks for each image with
-                the same shape of the input image.
+                the same shape of the input image, or binary masks already
+                downsampled to (H, W).
             pos_assigned_gt_inds (Tensor): GT indices of the corresponding
                 positive samples.
         Returns:
@@ -1010,11 +1337,12 @@ class YOLACTProtonet(nn.Module):
         if gt_masks.size(0) == 0:
             return None
         mask_h, mask_w = mask_pred.shape[-2:]
-        gt_masks = F.interpolate(
-            gt_masks.unsqueeze(0), (mask_h, mask_w),
-            mode='bilinear',
-            align_corners=False).squeeze(0)
-        gt_masks = gt_masks.gt(0.5).float()
+        if gt_masks.shape[-2:] != (mask_h, mask_w):
+            gt_masks = F.interpolate(
+                gt_masks.unsqueeze(0), (mask_h, mask_w),
+                mode='bilinear',
+                align_corners=False).squeeze(0)
+            gt_masks = gt_masks.gt(0.5).float()
         mask_targets = gt_masks[pos_assigned_gt_inds]
         return mask_targets
 
@@ -1039,47 +1367,49 @@ class YOLACTProtonet(nn.Module):
             img_w = np.round(ori_shape[1] * scale_factor[0]).astype(np.int32)
             scale_factor = 1.0
 
-        mask_pred = mask_pred.cpu().numpy()
-        mask_pred = mask_pred.astype(np.float32)
         cls_segms = [[] for _ in range(self.num_classes)]
+        if mask_pred.size(0) == 0:
+            return cls_segms
 
-        for m, l in zip(mask_pred, label_pred):
-            im_mask = mmcv.imresize(m, (img_w, img_h))
-            im_mask = (im_mask > 0.5).astype(np.uint8)
-            cls_segms[l].append(im_mask)
+        # resize and binarize all the masks on the device at once
+        im_masks = F.interpolate(
+            mask_pred.unsqueeze(0), (int(img_h), int(img_w)),
+            mode='bilinear',
+            align_corners=False).squeeze(0) > 0.5
+        im_masks = im_masks.to(dtype=torch.uint8).cpu().numpy()
+        for im_mask, label in zip(im_masks, label_pred.tolist()):
+            cls_segms[label].append(im_mask)
         return cls_segms
 
-    def crop(self, masks, boxes, padding=1):
+    def crop(self, masks, boxes, padding=1, with_sigmoid=False):
         """Crop predicted masks by zeroing out everything not in the predicted
         bbox.
         Args:
             masks (Tensor): shape [H, W, N].
             boxes (Tensor): bbox coords in relative point form with
                 shape [N, 4].
+            with_sigmoid (bool): If True, ``masks`` are logits and the sigmoid
+                is applied in the same pass as the cropping.
         Return:
             Tensor: The cropped masks.
         """
-        h, w, n = masks.size()
+        h, w = masks.shape[:2]
         x1, x2 = self.sanitize_coordinates(
             boxes[:, 0], boxes[:, 2], w, padding, cast=False)
         y1, y2 = self.sanitize_coordinates(
             boxes[:, 1], boxes[:, 3], h, padding, cast=False)
-
-        rows = torch.arange(
-            w, device=masks.device, dtype=x1.dtype).view(1, -1,
-                                                         1).expand(h, w, n)
-        cols = torch.arange(
-            h, device=masks.device, dtype=x1.dtype).view(-1, 1,
-                                                         1).expand(h, w, n)
-
-        masks_left = rows >= x1.view(1, 1, -1)
-        masks_right = rows < x2.view(1, 1, -1)
-        masks_up = cols >= y1.view(1, 1, -1)
-        masks_down = cols < y2.view(1, 1, -1)
-
-        crop_mask = masks_left * masks_right * masks_up * masks_down
-
-        return masks * crop_mask.float()
+        key = (masks.device, x1.dtype, h, w)
+        if key not in self._arange_cache:
+            # only keep the latest size, so the cache does not grow with
+            # multi-scale inputs
+            self._arange_cache = {
+                key: (torch.arange(w, device=masks.device,
+                                   dtype=x1.dtype).view(1, -1, 1),
+                      torch.arange(h, device=masks.device,
+                                   dtype=x1.dtype).view(-1, 1, 1))
+            }
+        rows, cols = self._arange_cache[key]
+        return _crop_masks(masks, rows, cols, x1, x2, y1, y2, with_sigmoid)
 
     def sanitize_coordinates(self, x1, x2, img_size, padding=0, cast=True):
         """Sanitizes the input coordinates so that x1 < x2, x1 != x2, x1 >= 0,
@@ -1103,10 +1433,11 @@ class YOLACTProtonet(nn.Module):
         if cast:
             x1 = x1.long()
             x2 = x2.long()
-        x1 = torch.min(x1, x2)
-        x2 = torch.max(x1, x2)
-        x1 = torch.clamp(x1 - padding, min=0)
-        x2 = torch.clamp(x2 + padding, max=img_size)
+        # both bounds are taken from the original coordinates, so swapped
+        # coordinates are sorted instead of collapsing onto x2
+        x1, x2 = torch.min(x1, x2), torch.max(x1, x2)
+        x1 = (x1 - padding).clamp_(min=0)
+        x2 = (x2 + padding).clamp_(max=img_size)
         return x1, x2
 
 
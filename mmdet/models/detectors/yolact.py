@@ -1,4 +1,5 @@
 import torch
+import torch.nn.functional as F
 
 from mmdet.core import bbox2result
 from ..builder import DETECTORS, build_head
@@ -23,6 +24,9 @@ class YOLACT(SingleStageDetector):
         self.segm_head = build_head(segm_head)
         self.mask_head = build_head(mask_head)
         self.init_segm_mask_weights()
+        # (input key, graph, static input, static outputs) of the captured
+        # test-time forward, see ``_graph_forward``
+        self._cuda_graph = None
 
     def init_segm_mask_weights(self):
         """Initialize weights of the YOLACT semg head and YOLACT mask head."""
@@ -75,29 +79,109 @@ class YOLACT(SingleStageDetector):
         losses, sampling_results = self.bbox_head.loss(
             *bbox_head_loss_inputs, gt_bboxes_ignore=gt_bboxes_ignore, gt_masks=gt_masks)
 
+        mask_pred = self.mask_head(x[0], coeff_pred, gt_bboxes, img_metas,
+                                   sampling_results)
+        # downsample the gt masks of all images to the prototype size once,
+        # both the segm head and the mask head build their targets from them
+        gt_masks = self.downsample_gt_masks(gt_masks,
+                                            mask_pred[0].shape[-2:])
+
         segm_head_outs = self.segm_head(x[0])
         loss_segm = self.segm_head.loss(segm_head_outs, gt_masks, gt_labels)
         losses.update(loss_segm)
 
-        mask_pred = self.mask_head(x[0], coeff_pred, gt_bboxes, img_metas,
-                                   sampling_results)
         loss_mask = self.mask_head.loss(mask_pred, gt_masks, gt_bboxes,
                                         img_metas, sampling_results)
         losses.update(loss_mask)
 
-        # check NaN and Inf
-        for loss_name in losses.keys():
-            assert torch.isfinite(torch.stack(losses[loss_name]))\
-                .all().item(), '{} becomes infinite or NaN!'\
-                .format(loss_name)
+        # check NaN and Inf in debug mode, all the losses are checked with a
+        # single device sync and the culprit is only looked up on failure
+        if self.train_cfg.get('debug', False):
+            all_losses = torch.cat([
+                loss.reshape(-1) for loss_list in losses.values()
+                for loss in loss_list
+            ])
+            if not torch.isfinite(all_losses).all().item():
+                for loss_name in losses.keys():
+                    assert torch.isfinite(torch.stack(losses[loss_name]))\
+                        .all().item(), '{} becomes infinite or NaN!'\
+                        .format(loss_name)
 
         return losses
 
-    def simple_test(self, img, img_meta, rescale=False):
-        """Test function without test time augmentation."""
+    def downsample_gt_masks(self, gt_masks, size):
+        """Downsample and binarize the gt masks of each image once.
+
+        Args:
+            gt_masks (list[Tensor]): Ground truth masks of each image with
+                the same shape of the input image.
+            size (tuple[int]): Target size (H, W).
+
+        Returns:
+            list[Tensor]: Binary float masks of each image with shape
+                (num_gts, H, W).
+        """
+
+        def _downsample(masks):
+            if masks.size(0) == 0:
+                return masks.new_zeros((0, ) + tuple(size), dtype=torch.float)
+            return F.interpolate(
+                masks.float().unsqueeze(0),
+                tuple(size),
+                mode='bilinear',
+                align_corners=False).squeeze(0).gt(0.5).float()
+
+        # one image at a time, so only the full resolution masks of a single
+        # image are converted to float at once
+        return [_downsample(masks) for masks in gt_masks]
+
+    def _forward_test_feats(self, img):
+        """Run the fixed-shape part of testing: the backbone, the neck and the
+        box head."""
         x = self.extract_feat(img)
+        return x[0], self.bbox_head(x)
 
-        cls_score, bbox_pred, coeff_pred = self.bbox_head(x)
+    def _graph_forward(self, img):
+        """Replay ``_forward_test_feats`` from a captured CUDA graph.
+
+        The graph is captured on the first call and again whenever the shape,
+        dtype or device of the input changes. The returned tensors are
+        static buffers which are overwritten by the next replay.
+        """
+        key = (tuple(img.shape), img.dtype, img.device)
+        if self._cuda_graph is None or self._cuda_graph[0] != key:
+            static_img = img.clone()
+            # warm up on a side stream before capturing, as required by
+            # CUDA graphs
+            stream = torch.cuda.Stream()
+            stream.wait_stream(torch.cuda.current_stream())
+            with torch.cuda.stream(stream):
+                for _ in range(3):
+                    self._forward_test_feats(static_img)
+            torch.cuda.current_stream().wait_stream(stream)
+            graph = torch.cuda.CUDAGraph()
+            with torch.cuda.graph(graph):
+                static_outs = self._forward_test_feats(static_img)
+            self._cuda_graph = (key, graph, static_img, static_outs)
+        _, graph, static_img, static_outs = self._cuda_graph
+        static_img.copy_(img)
+        graph.replay()
+        return static_outs
+
+    def simple_test(self, img, img_meta, rescale=False):
+        """Test function without test time augmentation.
+
+        If ``test_cfg.cuda_graph`` is True, the backbone, the neck and the box
+        head are captured into a CUDA graph and replayed for inputs of the
+        same shape, which needs a PyTorch with ``torch.cuda.CUDAGraph``.
+        """
+        if (self.test_cfg.get('cuda_graph', False) and img.is_cuda
+                and hasattr(torch.cuda, 'CUDAGraph')):
+            x0, (cls_score, bbox_pred,
+                 coeff_pred) = self._graph_forward(img)
+        else:
+            x0, (cls_score, bbox_pred,
+                 coeff_pred) = self._forward_test_feats(img)
 
         bbox_inputs = (cls_score, bbox_pred,
                        coeff_pred) + (img_meta, self.test_cfg, rescale)
@@ -113,7 +197,7 @@ class YOLACT(SingleStageDetector):
             scale_factor = torch.from_numpy(scale_factor).to(det_bboxes.device)
         _bboxes = (det_bboxes[:, :4] * scale_factor if rescale else det_bboxes)
 
-        mask_pred_list = self.mask_head(x[0], [det_coeffs], [_bboxes],
+        mask_pred_list = self.mask_head(x0, [det_coeffs], [_bboxes],
                                         img_meta)
 
         mask_results = self.mask_head.get_seg_masks(mask_pred_list[0],
@@ -7,7 +7,7 @@ from .dcn import (DeformConv, DeformConvPack, DeformRoIPooling,
                   deform_conv, deform_roi_pooling, modulated_deform_conv)
 from .generalized_attention import GeneralizedAttention
 from .masked_conv import MaskedConv2d
-from .nms import batched_nms, nms, nms_match, soft_nms
+from .nms import batched_nms, fast_nms_keep, nms, nms_match, soft_nms
 from .non_local import NonLocal2D
 from .plugin import build_plugin_layer
 from .point_sample import (SimpleRoIAlign, point_sample,
@@ -28,5 +28,6 @@ __all__ = [
     'get_compiler_version', 'get_compiling_cuda_version', 'ConvWS2d',
     'conv_ws_2d', 'build_plugin_layer', 'batched_nms', 'Conv2d',
     'ConvTranspose2d', 'MaxPool2d', 'Linear', 'nms_match', 'CornerPool',
-    'point_sample', 'rel_roi_point_to_rel_img_point', 'SimpleRoIAlign'
+    'point_sample', 'rel_roi_point_to_rel_img_point', 'SimpleRoIAlign',
+    'fast_nms_keep'
 ]
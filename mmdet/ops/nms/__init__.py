@@ -1,3 +1,4 @@
-from .nms_wrapper import batched_nms, nms, nms_match, soft_nms
+from .nms_wrapper import (batched_nms, fast_nms_keep, nms, nms_match,
+                          soft_nms)
 
-__all__ = ['nms', 'soft_nms', 'batched_nms', 'nms_match']
+__all__ = ['nms', 'soft_nms', 'batched_nms', 'nms_match', 'fast_nms_keep']
@@ -188,3 +188,24 @@ def nms_match(dets, thresh):
         return [dets.new_tensor(m, dtype=torch.long) for m in matched]
     else:
         return [np.array(m, dtype=np.int) for m in matched]
+
+
+def fast_nms_keep(boxes, iou_thr):
+    """Compute which boxes are kept by Fast NMS on GPU.
+
+    Fast NMS of `YOLACT <https://arxiv.org/abs/1904.02689>`_ discards a box
+    if any box of the same class with a higher score overlaps it by more than
+    ``iou_thr``, even if that box is discarded itself. The fused kernel checks
+    the boxes one by one and never builds the (#class, n, n) IoU matrix.
+
+    Arguments:
+        boxes (torch.Tensor): GPU tensor of shape (#class, n, 4), the boxes of
+            each class sorted by score in descending order.
+        iou_thr (float): IoU threshold to be considered as conflicted.
+
+    Returns:
+        torch.Tensor: Bool mask of shape (#class, n), True for kept boxes.
+    """
+    if not boxes.is_cuda:
+        raise TypeError('fast_nms_keep only supports GPU tensors')
+    return nms_ext.fast_nms(boxes, float(iou_thr))
@@ -0,0 +1,92 @@
+// Fast NMS of YOLACT (https://arxiv.org/abs/1904.02689) in a single kernel.
+#include <ATen/ATen.h>
+#include <ATen/DeviceGuard.h>
+#include <ATen/cuda/CUDAContext.h>
+
+#include <THC/THC.h>
+
+#define TILE_SIZE 64
+#define DIVUP(m, n) ((m) / (n) + ((m) % (n) > 0))
+
+// Whether the IoU of two boxes is above iou_thr, compared without dividing
+// by the union.
+template <typename scalar_t>
+__device__ inline bool bbox_iou_above(const scalar_t *a, const scalar_t *b,
+                                      const scalar_t iou_thr) {
+  scalar_t left = max(a[0], b[0]), right = min(a[2], b[2]);
+  scalar_t top = max(a[1], b[1]), bottom = min(a[3], b[3]);
+  scalar_t width = max(right - left, (scalar_t)0);
+  scalar_t height = max(bottom - top, (scalar_t)0);
+  scalar_t inter = width * height;
+  scalar_t area_a = (a[2] - a[0]) * (a[3] - a[1]);
+  scalar_t area_b = (b[2] - b[0]) * (b[3] - b[1]);
+  return inter > iou_thr * max(area_a + area_b - inter, (scalar_t)1e-6);
+}
+
+// Each thread decides a single box. The box is discarded as soon as any box
+// of the same class with a higher score overlaps it by more than iou_thr,
+// no matter whether that box is kept itself, which is what Fast NMS does with
+// the column-wise max of the upper triangular IoU matrix.
+// A block handles TILE_SIZE boxes of one class, and the higher-scored boxes
+// are staged tile by tile in shared memory, so each of them is read from
+// global memory once per block instead of once per thread.
+template <typename scalar_t>
+__global__ void fast_nms_kernel(const int num_dets, const scalar_t *boxes,
+                                const scalar_t iou_thr, bool *keep) {
+  __shared__ scalar_t tile_boxes[TILE_SIZE * 4];
+  const int cls_idx = blockIdx.y;
+  const int det_idx = blockIdx.x * TILE_SIZE + threadIdx.x;
+  const scalar_t *cls_boxes = boxes + cls_idx * num_dets * 4;
+
+  scalar_t cur_box[4];
+  if (det_idx < num_dets) {
+    for (int k = 0; k < 4; k++) cur_box[k] = cls_boxes[det_idx * 4 + k];
+  }
+  bool suppressed = false;
+  // only the tiles up to the one of this block hold higher-scored boxes
+  for (int tile_start = 0; tile_start <= blockIdx.x * TILE_SIZE;
+       tile_start += TILE_SIZE) {
+    const int load_idx = tile_start + threadIdx.x;
+    if (load_idx < num_dets) {
+      for (int k = 0; k < 4; k++)
+        tile_boxes[threadIdx.x * 4 + k] = cls_boxes[load_idx * 4 + k];
+    }
+    __syncthreads();
+    if (det_idx < num_dets && !suppressed) {
+      const int tile_end = min(TILE_SIZE, det_idx - tile_start);
+      for (int i = 0; i < tile_end; i++) {
+        if (bbox_iou_above(tile_boxes + i * 4, cur_box, iou_thr)) {
+          suppressed = true;
+          break;
+        }
+      }
+    }
+    __syncthreads();
+  }
+  if (det_idx < num_dets) keep[cls_idx * num_dets + det_idx] = !suppressed;
+}
+
+// boxes is a num_classes x num_dets x 4 tensor, sorted by score in each class
+at::Tensor fast_nms_cuda_forward(const at::Tensor boxes, const float iou_thr) {
+  // Ensure CUDA uses the input tensor device.
+  at::DeviceGuard guard(boxes.device());
+
+  const int num_classes = boxes.size(0);
+  const int num_dets = boxes.size(1);
+  const int output_size = num_classes * num_dets;
+  at::Tensor keep =
+      at::empty({num_classes, num_dets}, boxes.options().dtype(at::kBool));
+  if (output_size == 0) return keep;
+
+  const dim3 blocks(DIVUP(num_dets, TILE_SIZE), num_classes);
+
+  AT_DISPATCH_FLOATING_TYPES(
+      boxes.scalar_type(), "fast_nms_kernel", ([&] {
+        fast_nms_kernel<scalar_t><<<blocks, TILE_SIZE, 0,
+                                    at::cuda::getCurrentCUDAStream()>>>(
+            num_dets, boxes.data_ptr<scalar_t>(),
+            static_cast<scalar_t>(iou_thr), keep.data_ptr<bool>());
+      }));
+  THCudaCheck(cudaGetLastError());
+  return keep;
+}
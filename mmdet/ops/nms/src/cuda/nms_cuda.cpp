@@ -11,3 +11,10 @@ at::Tensor nms_cuda(const at::Tensor& dets, const float threshold) {
     return at::empty({0}, dets.options().dtype(at::kLong).device(at::kCPU));
   return nms_cuda_forward(dets, threshold);
 }
+
+at::Tensor fast_nms_cuda_forward(const at::Tensor boxes, const float iou_thr);
+
+at::Tensor fast_nms_cuda(const at::Tensor& boxes, const float iou_thr) {
+  CHECK_CUDA(boxes);
+  return fast_nms_cuda_forward(boxes.contiguous(), iou_thr);
+}
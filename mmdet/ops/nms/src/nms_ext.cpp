@@ -13,6 +13,8 @@ std::vector<std::vector<int> > nms_match_cpu(const at::Tensor& dets, const float
 
 #ifdef WITH_CUDA
 at::Tensor nms_cuda(const at::Tensor& dets, const float threshold);
+
+at::Tensor fast_nms_cuda(const at::Tensor& boxes, const float iou_thr);
 #endif
 
 at::Tensor nms(const at::Tensor& dets, const float threshold){
@@ -42,8 +44,20 @@ std::vector<std::vector<int> > nms_match(const at::Tensor& dets, const float thr
   return nms_match_cpu(dets, threshold);
 }
 
+at::Tensor fast_nms(const at::Tensor& boxes, const float iou_thr) {
+  if (boxes.device().is_cuda()) {
+#ifdef WITH_CUDA
+    return fast_nms_cuda(boxes, iou_thr);
+#else
+    AT_ERROR("fast_nms is not compiled with GPU support");
+#endif
+  }
+  AT_ERROR("fast_nms is not implemented on CPU");
+}
+
 PYBIND11_MODULE(TORCH_EXTENSION_NAME, m) {
   m.def("nms", &nms, "non-maximum suppression");
   m.def("soft_nms", &soft_nms, "soft non-maximum suppression");
   m.def("nms_match", &nms_match, "non-maximum suppression match");
+  m.def("fast_nms", &fast_nms, "fast non-maximum suppression of YOLACT");
 }
@@ -232,7 +232,8 @@ if __name__ == '__main__':
                 module='mmdet.ops.nms',
                 sources=['src/nms_ext.cpp', 'src/cpu/nms_cpu.cpp'],
                 sources_cuda=[
-                    'src/cuda/nms_cuda.cpp', 'src/cuda/nms_kernel.cu'
+                    'src/cuda/nms_cuda.cpp', 'src/cuda/nms_kernel.cu',
+                    'src/cuda/fast_nms_kernel.cu'
                 ]),
             make_cuda_ext(
                 name='roi_align_ext',
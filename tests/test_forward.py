@@ -381,4 +381,49 @@ def test_yolact_forward():
             result = detector.forward([one_img], [[one_meta]],
                                       rescale=True,
                                       return_loss=False)
-            batch_results.append(result)
\ No newline at end of file
+            batch_results.append(result)
+
+
+def test_yolact_cuda_graph_forward_gpu():
+    if not torch.cuda.is_available():
+        pytest.skip('test requires GPU and torch+cuda')
+    if not hasattr(torch.cuda, 'CUDAGraph'):
+        pytest.skip('test requires torch.cuda.CUDAGraph')
+
+    model, train_cfg, test_cfg = _get_detector_cfg(
+        'yolact/yolact_r50_1x8_coco.py')
+    model['pretrained'] = None
+
+    from mmdet.models import build_detector
+    detector = build_detector(model, train_cfg=train_cfg, test_cfg=test_cfg)
+    detector = detector.cuda().eval()
+
+    def _flatten(outs):
+        x0, head_outs = outs
+        return [x0] + [out for level_outs in head_outs for out in level_outs]
+
+    with torch.no_grad():
+        imgs = torch.rand(1, 3, 550, 550).cuda()
+        eager_outs = _flatten(detector._forward_test_feats(imgs))
+        graph_outs = _flatten(detector._graph_forward(imgs))
+        assert len(graph_outs) == len(eager_outs)
+        for graph_out, eager_out in zip(graph_outs, eager_outs):
+            assert torch.allclose(graph_out, eager_out, atol=1e-4)
+        key, graph = detector._cuda_graph[:2]
+
+        # the same shape replays the captured graph on the new input
+        imgs = torch.rand(1, 3, 550, 550).cuda()
+        eager_outs = _flatten(detector._forward_test_feats(imgs))
+        graph_outs = _flatten(detector._graph_forward(imgs))
+        assert detector._cuda_graph[1] is graph
+        for graph_out, eager_out in zip(graph_outs, eager_outs):
+            assert torch.allclose(graph_out, eager_out, atol=1e-4)
+
+        # a new shape triggers a new capture
+        imgs = torch.rand(1, 3, 512, 512).cuda()
+        eager_outs = _flatten(detector._forward_test_feats(imgs))
+        graph_outs = _flatten(detector._graph_forward(imgs))
+        assert detector._cuda_graph[0] != key
+        assert detector._cuda_graph[1] is not graph
+        for graph_out, eager_out in zip(graph_outs, eager_outs):
+            assert torch.allclose(graph_out, eager_out, atol=1e-4)
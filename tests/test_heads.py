@@ -1,7 +1,11 @@
 import mmcv
+import numpy as np
 import torch
+import torch.nn.functional as F
 
-from mmdet.core import bbox2roi, build_assigner, build_sampler
+from mmdet.core import (AssignResult, PseudoSampler, bbox2roi,
+                        build_assigner, build_sampler, fast_nms,
+                        images_to_levels)
 from mmdet.models.dense_heads import (AnchorHead, FCOSHead, FSAFHead,
                                       GuidedAnchorHead, YOLACTHead,
                                       YOLACTProtonet, YOLACTSegmHead)
@@ -634,15 +638,9 @@ def _dummy_bbox_sampling(proposal_list, gt_bboxes, gt_labels):
     return sampling_results
 
 
-def test_yolact_head_loss():
-    """Tests yolact head losses when truth is empty and non-empty."""
-    s = 550
-    img_metas = [{
-        'img_shape': (s, s, 3),
-        'scale_factor': 1,
-        'pad_shape': (s, s, 3)
-    }]
-    train_cfg = mmcv.Config(
+def _yolact_train_cfg():
+    """Create the train config shared by the yolact head tests."""
+    return mmcv.Config(
         dict(
             assigner=dict(
                 type='MaxIoUAssigner',
@@ -657,6 +655,17 @@ def test_yolact_head_loss():
             neg_pos_ratio=3,
             debug=False,
             min_gt_box_wh=[4.0, 4.0]))
+
+
+def test_yolact_head_loss():
+    """Tests yolact head losses when truth is empty and non-empty."""
+    s = 550
+    img_metas = [{
+        'img_shape': (s, s, 3),
+        'scale_factor': 1,
+        'pad_shape': (s, s, 3)
+    }]
+    train_cfg = _yolact_train_cfg()
     bbox_head = YOLACTHead(
         num_classes=80,
         in_channels=256,
@@ -763,4 +772,383 @@ def test_yolact_head_loss():
     one_gt_segm_loss = sum(one_gt_segm_loss['loss_segm'])
     one_gt_mask_loss = sum(one_gt_mask_loss['loss_mask'])
     assert one_gt_segm_loss.item() > 0, 'segm loss should be non-zero'
-    assert one_gt_mask_loss.item() > 0, 'mask loss should be non-zero'
\ No newline at end of file
+    assert one_gt_mask_loss.item() > 0, 'mask loss should be non-zero'
+
+    # Test the head without OHEM, which uses the dense targets of each level
+    bbox_head = YOLACTHead(
+        num_classes=80,
+        in_channels=256,
+        feat_channels=256,
+        anchor_generator=dict(
+            type='AnchorGenerator',
+            octave_base_scale=3,
+            scales_per_octave=1,
+            base_sizes=[8, 16, 32, 64, 128],
+            ratios=[0.5, 1.0, 2.0],
+            strides=[550.0 / x for x in [69, 35, 18, 9, 5]],
+            centers=[(550 * 0.5 / x, 550 * 0.5 / x)
+                     for x in [69, 35, 18, 9, 5]]),
+        bbox_coder=dict(
+            type='DeltaXYWHBBoxCoder',
+            target_means=[.0, .0, .0, .0],
+            target_stds=[0.1, 0.1, 0.2, 0.2]),
+        loss_cls=dict(
+            type='CrossEntropyLoss', use_sigmoid=False, loss_weight=1.0),
+        loss_bbox=dict(type='SmoothL1Loss', beta=1.0, loss_weight=1.5),
+        num_head_convs=1,
+        num_protos=32,
+        use_ohem=False,
+        train_cfg=train_cfg)
+    cls_score, bbox_pred, coeff_pred = bbox_head.forward(feat)
+    empty_gt_losses, _ = bbox_head.loss(
+        cls_score,
+        bbox_pred, [torch.empty((0, 4))], [torch.LongTensor([])],
+        img_metas,
+        gt_bboxes_ignore=gt_bboxes_ignore)
+    empty_cls_loss = sum(empty_gt_losses['loss_cls'])
+    empty_box_loss = sum(empty_gt_losses['loss_bbox'])
+    assert empty_cls_loss.item() > 0, 'cls loss should be non-zero'
+    assert empty_box_loss.item() == 0, (
+        'there should be no box loss when there are no true boxes')
+    one_gt_losses, _ = bbox_head.loss(
+        cls_score,
+        bbox_pred,
+        gt_bboxes,
+        gt_labels,
+        img_metas,
+        gt_bboxes_ignore=gt_bboxes_ignore)
+    one_gt_cls_loss = sum(one_gt_losses['loss_cls'])
+    one_gt_box_loss = sum(one_gt_losses['loss_bbox'])
+    assert one_gt_cls_loss.item() > 0, 'cls loss should be non-zero'
+    assert one_gt_box_loss.item() > 0, 'box loss should be non-zero'
+
+    # The batched level targets match the targets built image by image
+    img_metas = img_metas * 2
+    gt_bboxes = [gt_bboxes[0], torch.Tensor([[100., 200., 400., 500.]])]
+    gt_labels = [gt_labels[0], torch.LongTensor([7])]
+    featmap_sizes = [featmap.size()[-2:] for featmap in feat]
+    anchor_list, valid_flag_list = bbox_head.get_anchors(
+        featmap_sizes, img_metas, device='cpu')
+    num_level_anchors = [anchors.size(0) for anchors in anchor_list[0]]
+    targets = bbox_head.get_targets(
+        anchor_list,
+        valid_flag_list,
+        gt_bboxes,
+        img_metas,
+        gt_labels_list=gt_labels)
+    ref_targets = [[], [], [], []]
+    for i in range(2):
+        flat_anchors = torch.cat(anchor_list[i])
+        (pos_inds, neg_inds, pos_labels, pos_bbox_targets,
+         _) = bbox_head._get_targets_single(flat_anchors,
+                                            torch.cat(valid_flag_list[i]),
+                                            num_level_anchors, gt_bboxes[i],
+                                            None, gt_labels[i], None,
+                                            img_metas[i])
+        assert len(pos_inds) > 0
+        labels = flat_anchors.new_full((flat_anchors.size(0), ),
+                                       bbox_head.background_label,
+                                       dtype=torch.long)
+        labels[pos_inds] = pos_labels
+        label_weights = flat_anchors.new_zeros(flat_anchors.size(0))
+        label_weights[pos_inds] = 1.0
+        label_weights[neg_inds] = 1.0
+        bbox_targets = torch.zeros_like(flat_anchors)
+        bbox_targets[pos_inds] = pos_bbox_targets
+        bbox_weights = torch.zeros_like(flat_anchors)
+        bbox_weights[pos_inds] = 1.0
+        image_targets = (labels, label_weights, bbox_targets, bbox_weights)
+        for ref, target in zip(ref_targets, image_targets):
+            ref.append(target)
+    for level_targets, ref in zip(targets[:4], ref_targets):
+        ref_level_targets = images_to_levels(ref, num_level_anchors)
+        assert len(level_targets) == len(ref_level_targets)
+        for target, ref_target in zip(level_targets, ref_level_targets):
+            assert torch.equal(target, ref_target)
+
+
+def test_yolact_head_get_bboxes():
+    """Tests yolact head gives the same detections as the former per-level
+    loop."""
+    s = 550
+    img_metas = [{
+        'img_shape': (s, s, 3),
+        'scale_factor': np.array([0.5, 0.6, 0.5, 0.6], dtype=np.float32)
+    }, {
+        'img_shape': (s, s, 3),
+        'scale_factor': np.array([1., 1., 1., 1.], dtype=np.float32)
+    }]
+    # nms_pre is smaller than the largest level and larger than the smallest
+    test_cfg = mmcv.Config(
+        dict(
+            nms_pre=100,
+            score_thr=0.01,
+            iou_thr=0.5,
+            top_k=200,
+            max_per_img=100))
+    bbox_head = YOLACTHead(
+        num_classes=80,
+        in_channels=256,
+        num_protos=32,
+        train_cfg=_yolact_train_cfg(),
+        test_cfg=test_cfg)
+    bbox_head.eval()
+    feat = [
+        torch.rand(2, 256, feat_size, feat_size)
+        for feat_size in [69, 35, 18, 9, 5]
+    ]
+    with torch.no_grad():
+        cls_scores, bbox_preds, coeff_preds = bbox_head(feat)
+        result_list = bbox_head.get_bboxes(
+            cls_scores, bbox_preds, coeff_preds, img_metas, rescale=True)
+
+    featmap_sizes = [featmap.size()[-2:] for featmap in cls_scores]
+    mlvl_anchors = bbox_head.anchor_generator.grid_anchors(
+        featmap_sizes, device='cpu')
+    for img_id, img_meta in enumerate(img_metas):
+        mlvl_bboxes = []
+        mlvl_scores = []
+        mlvl_coeffs = []
+        for cls_score, bbox_pred, coeff_pred, anchors in zip(
+                cls_scores, bbox_preds, coeff_preds, mlvl_anchors):
+            scores = cls_score[img_id].permute(1, 2, 0).reshape(
+                -1, bbox_head.cls_out_channels).softmax(-1)
+            bbox_pred = bbox_pred[img_id].permute(1, 2, 0).reshape(-1, 4)
+            coeff_pred = coeff_pred[img_id].permute(1, 2, 0).reshape(
+                -1, bbox_head.num_protos)
+            if scores.shape[0] > test_cfg.nms_pre:
+                max_scores, _ = scores[:, :-1].max(dim=1)
+                _, topk_inds = max_scores.topk(test_cfg.nms_pre)
+                anchors = anchors[topk_inds, :]
+                bbox_pred = bbox_pred[topk_inds, :]
+                scores = scores[topk_inds, :]
+                coeff_pred = coeff_pred[topk_inds, :]
+            mlvl_bboxes.append(
+                bbox_head.bbox_coder.decode(
+                    anchors, bbox_pred, max_shape=img_meta['img_shape']))
+            mlvl_scores.append(scores)
+            mlvl_coeffs.append(coeff_pred)
+        mlvl_bboxes = torch.cat(mlvl_bboxes)
+        mlvl_bboxes /= mlvl_bboxes.new_tensor(img_meta['scale_factor'])
+        expected_bboxes, expected_labels, expected_coeffs = fast_nms(
+            mlvl_bboxes, torch.cat(mlvl_scores), torch.cat(mlvl_coeffs),
+            test_cfg.score_thr, test_cfg.iou_thr, test_cfg.top_k,
+            test_cfg.max_per_img)
+
+        det_bboxes, det_labels, det_coeffs = result_list[img_id]
+        assert det_bboxes.size(0) > 0
+        assert torch.allclose(det_bboxes, expected_bboxes)
+        assert torch.equal(det_labels, expected_labels)
+        assert torch.allclose(det_coeffs, expected_coeffs)
+
+def test_yolact_head_load_unfused_convs():
+    """Tests yolact head loads checkpoints with separated cls, reg and coeff
+    convs."""
+    train_cfg = _yolact_train_cfg()
+    bbox_head = YOLACTHead(
+        num_classes=80, in_channels=256, num_protos=32, train_cfg=train_cfg)
+    state_dict = bbox_head.state_dict()
+    split_channels = bbox_head.head_split_channels
+    for name in ['weight', 'bias']:
+        params = torch.split(
+            state_dict.pop('conv_head.' + name), split_channels)
+        for conv, param in zip(['conv_cls', 'conv_reg', 'conv_coeff'],
+                               params):
+            state_dict[conv + '.' + name] = param
+    # checkpoints saved before the convs are fused have no version
+    state_dict._metadata = {'': {}}
+
+    new_head = YOLACTHead(
+        num_classes=80, in_channels=256, num_protos=32, train_cfg=train_cfg)
+    new_head.load_state_dict(state_dict)
+    assert torch.equal(new_head.conv_head.weight, bbox_head.conv_head.weight)
+    assert torch.equal(new_head.conv_head.bias, bbox_head.conv_head.bias)
+
+
+def test_yolact_head_anchor_cache():
+    """Tests yolact head reuses the anchors of the latest feature map sizes
+    and drops them when the mode is switched."""
+    bbox_head = YOLACTHead(
+        num_classes=80,
+        in_channels=256,
+        num_protos=32,
+        train_cfg=_yolact_train_cfg())
+    featmap_sizes = [(69, 69), (35, 35), (18, 18), (9, 9), (5, 5)]
+    anchors = bbox_head.get_grid_anchors(featmap_sizes, device='cpu')
+    # the same sizes hit the cache
+    assert bbox_head.get_grid_anchors(featmap_sizes, device='cpu') is anchors
+    expected_anchors = bbox_head.anchor_generator.grid_anchors(
+        featmap_sizes, device='cpu')
+    for level_anchors, expected in zip(anchors, expected_anchors):
+        assert torch.equal(level_anchors, expected)
+
+    # new sizes evict the anchors of the previous sizes
+    new_featmap_sizes = [(size[0] + 1, size[1] + 1) for size in featmap_sizes]
+    new_anchors = bbox_head.get_grid_anchors(new_featmap_sizes, device='cpu')
+    assert new_anchors is not anchors
+    assert len(bbox_head._anchor_cache) == 1
+    assert new_anchors[0].size(0) == 70 * 70 * 3
+    assert bbox_head.get_grid_anchors(featmap_sizes, device='cpu') \
+        is not anchors
+
+    # switching the mode clears the cache
+    bbox_head.train()
+    assert len(bbox_head._anchor_cache) == 0
+    anchors = bbox_head.get_grid_anchors(featmap_sizes, device='cpu')
+    bbox_head.eval()
+    assert len(bbox_head._anchor_cache) == 0
+    assert bbox_head.get_grid_anchors(featmap_sizes, device='cpu') \
+        is not anchors
+
+
+def test_yolact_segm_head_get_targets():
+    """Tests yolact segm head targets match the per-object max."""
+    segm_head = YOLACTSegmHead(in_channels=256, num_classes=80)
+    segm_pred = torch.rand(80, 69, 69)
+    gt_masks = (torch.rand((4, 550, 550)) > 0.5).float()
+    # label 0 wraps to the last channel, and two overlapping objects share
+    # the same class
+    gt_labels = torch.LongTensor([0, 3, 3, 80])
+    gt_masks[2, :300, :300] = 1
+    gt_masks[1, 100:400, 100:400] = 1
+
+    downsampled_masks = F.interpolate(
+        gt_masks.unsqueeze(0), (69, 69), mode='bilinear',
+        align_corners=False).squeeze(0).gt(0.5).float()
+    expected_targets = torch.zeros_like(segm_pred)
+    for obj_idx in range(downsampled_masks.size(0)):
+        expected_targets[gt_labels[obj_idx] - 1] = torch.max(
+            expected_targets[gt_labels[obj_idx] - 1],
+            downsampled_masks[obj_idx])
+
+    segm_targets = segm_head.get_targets(segm_pred, gt_masks, gt_labels)
+    assert torch.equal(segm_targets, expected_targets)
+    assert segm_targets[79].sum() > 0
+    # masks that are already downsampled give the same targets
+    segm_targets = segm_head.get_targets(segm_pred, downsampled_masks,
+                                         gt_labels)
+    assert torch.equal(segm_targets, expected_targets)
+    assert segm_head.get_targets(segm_pred, torch.empty((0, 550, 550)),
+                                 torch.LongTensor([])) is None
+
+def test_yolact_protonet_sanitize_coordinates():
+    """Tests yolact protonet sorts swapped box coordinates."""
+    mask_head = YOLACTProtonet(num_classes=80, in_channels=256, num_protos=32)
+    x1 = torch.Tensor([0.1, 0.6, 0.])
+    x2 = torch.Tensor([0.5, 0.2, 1.])
+    x1, x2 = mask_head.sanitize_coordinates(x1, x2, 100, padding=1, cast=False)
+    assert torch.allclose(x1, torch.Tensor([9., 19., 0.]))
+    assert torch.allclose(x2, torch.Tensor([51., 61., 100.]))
+
+
+def test_yolact_protonet_forward_test_boxes():
+    """Tests yolact protonet crops with detected boxes that have scores."""
+    s = 550
+    img_metas = [{'img_shape': (s, s, 3), 'scale_factor': 1}]
+    mask_head = YOLACTProtonet(num_classes=80, in_channels=256, num_protos=32)
+    mask_head.eval()
+    x = torch.rand(1, 256, 18, 18)
+    # ``simple_test`` passes (N, 5) boxes when ``rescale=False``
+    det_bboxes = torch.Tensor([[23.6667, 23.8757, 238.6326, 151.8874, 0.9],
+                               [0., 100., 300., 400., 0.5]])
+    mask_pred = mask_head(x, [torch.rand(2, 32)], [det_bboxes], img_metas)
+    assert mask_pred[0].shape == (2, 36, 36)
+    assert torch.equal(det_bboxes[:, 4], torch.Tensor([0.9, 0.5]))
+
+    mask_pred = mask_head(x, [torch.rand(0, 32)], [torch.empty((0, 5))],
+                          img_metas)
+    assert mask_pred[0].shape == (0, 36, 36)
+
+
+def test_yolact_protonet_channels_last():
+    """Tests yolact protonet gives the same masks in channels last."""
+    s = 550
+    img_metas = [{'img_shape': (s, s, 3), 'scale_factor': 1}] * 2
+    mask_head = YOLACTProtonet(num_classes=80, in_channels=256, num_protos=32)
+    channels_last_head = YOLACTProtonet(
+        num_classes=80, in_channels=256, num_protos=32, channels_last=True)
+    channels_last_head.load_state_dict(mask_head.state_dict())
+    mask_head.eval()
+    channels_last_head.eval()
+    x = torch.rand(2, 256, 18, 18)
+    coeff_pred = [torch.rand(2, 32), torch.rand(2, 32)]
+    bboxes = [
+        torch.Tensor([[23.6667, 23.8757, 238.6326, 151.8874],
+                      [0., 100., 300., 400.]]),
+        torch.Tensor([[10., 20., 30., 40.], [100., 200., 400., 500.]])
+    ]
+    with torch.no_grad():
+        mask_pred = mask_head(x, coeff_pred, bboxes, img_metas)
+        channels_last_pred = channels_last_head(x, coeff_pred, bboxes,
+                                                img_metas)
+    for pred, channels_last in zip(mask_pred, channels_last_pred):
+        assert pred.shape == (2, 36, 36)
+        assert torch.allclose(pred, channels_last, atol=1e-5)
+
+
+def test_yolact_protonet_loss():
+    """Tests yolact protonet mask losses match the per-image losses."""
+    s = 550
+    img_metas = [{'img_shape': (s, s, 3), 'scale_factor': 1}] * 3
+    mask_head = YOLACTProtonet(
+        num_classes=80, in_channels=256, num_protos=32, loss_mask_weight=6.125)
+    gt_bboxes = [
+        torch.Tensor([[23.6667, 23.8757, 238.6326, 151.8874],
+                      [100., 200., 400., 500.]]),
+        torch.Tensor([[10., 20., 30., 40.]]),
+        torch.Tensor([[0., 0., 550., 550.], [50., 60., 300., 200.]])
+    ]
+    gt_masks = [(torch.rand((len(bboxes), s, s)) > 0.5).float()
+                for bboxes in gt_bboxes]
+    # the middle image has no positive anchors
+    gt_inds_list = [
+        torch.LongTensor([1, 2, 0, 1]),
+        torch.LongTensor([0, 0, 0, 0]),
+        torch.LongTensor([2, 0, 1, 2])
+    ]
+    anchors = torch.Tensor([[0., 0., 100., 100.]]).repeat(4, 1)
+    sampler = PseudoSampler()
+    sampling_results = [
+        sampler.sample(
+            AssignResult(len(bboxes), gt_inds, None), anchors, bboxes)
+        for gt_inds, bboxes in zip(gt_inds_list, gt_bboxes)
+    ]
+    mask_pred = [
+        torch.rand(len(result.pos_inds), 138, 138)
+        for result in sampling_results
+    ]
+
+    # the former per-image computation
+    expected_losses = []
+    total_pos = 0
+    for cur_mask_pred, cur_gt_masks, cur_gt_bboxes, result in zip(
+            mask_pred, gt_masks, gt_bboxes, sampling_results):
+        pos_assigned_gt_inds = result.pos_assigned_gt_inds
+        num_pos = pos_assigned_gt_inds.size(0)
+        total_pos += num_pos
+        if num_pos == 0:
+            expected_losses.append(cur_mask_pred.sum() * 0.)
+            continue
+        mask_targets = F.interpolate(
+            cur_gt_masks.unsqueeze(0), (138, 138),
+            mode='bilinear',
+            align_corners=False).squeeze(0).gt(0.5).float()
+        mask_targets = mask_targets[pos_assigned_gt_inds]
+        loss = F.binary_cross_entropy(
+            torch.clamp(cur_mask_pred, 0, 1), mask_targets,
+            reduction='none') * mask_head.loss_mask_weight
+        gt_bboxes_for_reweight = cur_gt_bboxes[pos_assigned_gt_inds]
+        gt_bboxes_width = (gt_bboxes_for_reweight[:, 2] -
+                           gt_bboxes_for_reweight[:, 0]) / s
+        gt_bboxes_height = (gt_bboxes_for_reweight[:, 3] -
+                            gt_bboxes_for_reweight[:, 1]) / s
+        loss = loss.mean(dim=(1, 2)) / gt_bboxes_width / gt_bboxes_height
+        expected_losses.append(torch.sum(loss))
+    expected_losses = [loss / total_pos for loss in expected_losses]
+
+    loss_mask = mask_head.loss(mask_pred, gt_masks, gt_bboxes, img_metas,
+                               sampling_results)['loss_mask']
+    assert len(loss_mask) == 3
+    assert loss_mask[1].item() == 0
+    for loss, expected_loss in zip(loss_mask, expected_losses):
+        assert torch.allclose(loss, expected_loss, rtol=1e-4)
@@ -0,0 +1,52 @@
+"""
+Tests the fused IoU of the 2D IoU calculator.
+
+CommandLine:
+    pytest tests/test_iou2d_calculator.py
+"""
+import torch
+
+from mmdet.core.bbox.iou_calculators.iou2d_calculator import (_pairwise_iou,
+                                                              bbox_overlaps)
+
+
+def _random_boxes(num, scale=100.):
+    xy = torch.rand(num, 2) * scale
+    wh = torch.rand(num, 2) * scale / 2
+    return torch.cat([xy, xy + wh], dim=1)
+
+
+def test_pairwise_iou_random():
+    torch.manual_seed(0)
+    bboxes1 = _random_boxes(30)
+    bboxes2 = _random_boxes(40)
+    # a leading batch dim takes the generic path of ``bbox_overlaps``
+    expected = bbox_overlaps(bboxes1[None], bboxes2[None])[0]
+    ious = _pairwise_iou(bboxes1, bboxes2, 1e-6)
+    assert ious.shape == (30, 40)
+    assert torch.allclose(ious, expected)
+    assert torch.allclose(bbox_overlaps(bboxes1, bboxes2), expected)
+
+
+def test_pairwise_iou_zero_area():
+    bboxes1 = torch.FloatTensor([[10, 10, 10, 10], [0, 0, 10, 0],
+                                 [0, 0, 10, 10]])
+    bboxes2 = torch.FloatTensor([[10, 10, 10, 10], [5, 5, 5, 20],
+                                 [0, 0, 10, 10]])
+    expected = bbox_overlaps(bboxes1[None], bboxes2[None])[0]
+    ious = _pairwise_iou(bboxes1, bboxes2, 1e-6)
+    assert torch.isfinite(ious).all()
+    assert torch.allclose(ious, expected)
+    # only the two identical non-degenerate boxes overlap
+    assert ious[2, 2] == 1
+    assert ious.sum() == 1
+
+
+def test_pairwise_iou_no_overlap():
+    bboxes1 = torch.FloatTensor([[0, 0, 10, 10], [20, 20, 30, 30]])
+    bboxes2 = torch.FloatTensor([[10, 10, 20, 20], [40, 0, 50, 10],
+                                 [0, 30, 10, 40]])
+    expected = bbox_overlaps(bboxes1[None], bboxes2[None])[0]
+    ious = _pairwise_iou(bboxes1, bboxes2, 1e-6)
+    assert torch.equal(ious, expected)
+    assert torch.equal(ious, ious.new_zeros((2, 3)))
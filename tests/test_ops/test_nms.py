@@ -6,7 +6,7 @@ import numpy as np
 import pytest
 import torch
 
-from mmdet.ops.nms.nms_wrapper import nms, nms_match
+from mmdet.ops.nms.nms_wrapper import fast_nms_keep, nms, nms_match
 
 
 def test_nms_device_and_dtypes_cpu():
@@ -111,3 +111,70 @@ def test_nms_match():
     wrong_dets = np.zeros((2, 3))
     with pytest.raises(AssertionError):
         nms_match(wrong_dets, iou_thr)
+
+
+def test_fast_nms_cpu():
+    from mmdet.core import fast_nms
+    boxes = torch.FloatTensor([[49.1, 32.4, 51.0, 35.9],
+                               [49.3, 32.9, 51.0, 35.3],
+                               [35.3, 11.5, 39.9, 14.5],
+                               [35.2, 11.7, 39.7, 15.7]])
+    scores = torch.FloatTensor([[0.9, 0.], [0.8, 0.], [0.7, 0.], [0.6, 0.]])
+    coeffs = torch.arange(8).float().view(4, 2)
+
+    # the 2nd and 4th boxes overlap the 1st and 3rd ones with IoU > 0.6
+    dets, labels, det_coeffs = fast_nms(boxes, scores, coeffs, 0.05, 0.6, 200)
+    assert torch.equal(dets[:, :4], boxes[[0, 2]])
+    assert torch.equal(dets[:, 4], scores[[0, 2], 0])
+    assert torch.equal(labels, labels.new_zeros(2))
+    assert torch.equal(det_coeffs, coeffs[[0, 2]])
+
+    # nothing is suppressed below the IoU threshold
+    dets, _, _ = fast_nms(boxes, scores, coeffs, 0.05, 0.65, 200)
+    assert torch.equal(dets[:, :4], boxes)
+
+    # many detections are processed in several blocks of rows
+    from mmdet.core.bbox.iou_calculators import bbox_overlaps
+    torch.manual_seed(0)
+    xy = torch.rand(150, 2) * 100
+    boxes = torch.cat([xy, xy + torch.rand(150, 2) * 50 + 1], dim=1)
+    scores = torch.rand(150, 4)
+    coeffs = torch.rand(150, 2)
+    iou_thr = 0.5
+    dets, labels, _ = fast_nms(boxes, scores, coeffs, 0., iou_thr, 200)
+    cls_scores, idx = scores[:, :-1].t().sort(1, descending=True)
+    cls_boxes = boxes[idx]
+    iou = bbox_overlaps(cls_boxes, cls_boxes)
+    iou.triu_(diagonal=1)
+    expected_keep = iou.max(dim=1)[0] <= iou_thr
+    assert 0 < dets.size(0) < 450
+    expected_scores, _ = cls_scores[expected_keep].sort(descending=True)
+    assert torch.equal(dets[:, 4], expected_scores)
+    for label in range(3):
+        assert (labels == label).sum() == expected_keep[label].sum()
+
+
+def test_fast_nms_keep_gpu():
+    if not torch.cuda.is_available():
+        pytest.skip('test requires GPU and torch+cuda')
+
+    from mmdet.core.bbox.iou_calculators import bbox_overlaps
+    boxes = torch.FloatTensor([[[49.1, 32.4, 51.0, 35.9],
+                                [49.3, 32.9, 51.0, 35.3],
+                                [35.3, 11.5, 39.9, 14.5],
+                                [35.2, 11.7, 39.7, 15.7]],
+                               [[35.2, 11.7, 39.7, 15.7],
+                                [35.3, 11.5, 39.9, 14.5],
+                                [49.1, 32.4, 51.0, 35.9],
+                                [49.3, 32.9, 51.0, 35.3]]])
+    iou_thr = 0.6
+    iou = bbox_overlaps(boxes, boxes)
+    iou.triu_(diagonal=1)
+    expected_keep = iou.max(dim=1)[0] <= iou_thr
+
+    keep = fast_nms_keep(boxes.cuda(), iou_thr)
+    assert keep.dtype == torch.bool
+    assert torch.equal(keep.cpu(), expected_keep)
+
+    with pytest.raises(TypeError):
+        fast_nms_keep(boxes, iou_thr)